@@ -0,0 +1,238 @@
+# *******************************************************************************
+# Copyright (C) 2021 INAF
+#
+# This software is distributed under the terms of the BSD-3-Clause license
+#
+# Authors:
+# Ambra Di Piano <ambra.dipiano@inaf.it>
+# Simone Tampieri <simone.tampieri@inaf.it>
+# *******************************************************************************
+
+import numpy as np
+from astropy.io import fits
+from scipy import integrate
+from rtasci.aph.utils import li_ma_array, get_excess_array
+from rtasci.aph.irf import get_irf
+
+def template_time_edges(times):
+    '''Edges of the template time slices, as getTimeSlices and the time_slices.csv table used by the simulations: each slice ends at its time and starts at the end of the previous one, the first at 0.
+
+    Parameter
+    ---------
+    times : array
+        template slices times in seconds
+
+    Return
+    ------
+    edges : ndarray
+        slices edges in seconds
+    '''
+    return np.append(0, np.asarray(times, dtype=np.float64))
+
+def loglog_interpolation(x, xp, fp):
+    '''Interpolate each row of fp linearly in log-log space, zero outside xp and where fp is zero.
+
+    Parameter
+    ---------
+    x : array
+        points where to evaluate
+    xp : array
+        increasing abscissae of the rows of fp
+    fp : ndarray
+        values with shape (rows, len(xp))
+
+    Return
+    ------
+    values : ndarray
+        interpolated values with shape (rows, len(x))
+    '''
+    log_x, log_xp = np.log10(x), np.log10(xp)
+    right = np.clip(np.searchsorted(log_xp, log_x), 1, len(log_xp) - 1)
+    weights = (log_x - log_xp[right - 1]) / (log_xp[right] - log_xp[right - 1])
+    with np.errstate(divide='ignore'):
+        log_fp = np.log10(np.asarray(fp, dtype=np.float64))
+    with np.errstate(invalid='ignore'):
+        values = 10**(log_fp[:, right - 1] * (1 - weights) + log_fp[:, right] * weights)
+    outside = (x < xp[0]) | (x > xp[-1])
+    values[:, outside] = 0.0
+    return np.nan_to_num(values, nan=0.0)
+
+class AsimovCounts():
+    '''Expected on-source and background counts of a source observed at a fixed offset, for many exposure windows at once. The source rate is the spectrum folded with the effective area and the psf containment of the on region on a log energy grid; the background rate is the IRF background cube integrated over the on region. Off counts are the Asimov expectation bkg / alpha of the reflected regions, which share the offset of the on region.
+
+    Parameter
+    ---------
+    irf_file : str
+        path to IRF in FITS format
+    offset : float
+        source offset from the pointing in degrees
+    rad : float
+        on region radius in degrees
+    erange : list
+        energy interval with [emin, emax] in TeV
+    time_edges : array
+        edges of the time slices of the spectra in seconds
+    spectra : ndarray
+        flux in [ph/cm2/s/MeV] with shape (slices, energies)
+    energies : array
+        energies of the spectra in TeV
+    alpha : float
+        alpha parameter, 1 / number of off regions
+    nbin : int
+        number of points of the log energy integration grid
+    pixel_size : float
+        size of a pixel in degrees for the background integration
+    '''
+    def __init__(self, irf_file, offset, rad, erange, time_edges, spectra, energies, alpha=0.2, nbin=1000, pixel_size=0.05):
+        if erange[0] <= 0 or erange[1] <= erange[0]:
+            raise Exception('need 0 < emin < emax')
+        self.time_edges = np.asarray(time_edges, dtype=np.float64)
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=np.float64))
+        if spectra.shape[0] != len(self.time_edges) - 1:
+            raise Exception('need one spectrum for each time slice')
+        self.alpha = alpha
+        irf = get_irf(irf_file)
+        grid = np.logspace(np.log10(erange[0]), np.log10(erange[1]), nbin)
+        # these IRFs return value in m², so we need convert
+        response = irf.effective_area().aeff(offset, grid) * irf.psf().containment(offset, grid, rad) * 1e4 # cm2
+        flux = loglog_interpolation(grid, np.asarray(energies, dtype=np.float64), spectra)
+        # ph/cm2/s/MeV * cm2 * dMeV = ph/s
+        self.source_rates = integrate.trapezoid(flux * response, grid * 1e6, axis=1)
+        # the on region lies at the given offset north of a pointing at the origin
+        region = {'ra': 0.0, 'dec': float(offset), 'rad': float(rad)}
+        self.background_rate = irf.background().region_rates([region], {'ra': 0.0, 'dec': 0.0}, erange, pixel_size)[0]
+
+    @classmethod
+    def from_powerlaw(cls, irf_file, offset, rad, erange, k0, index=-2.4, e0=1e6, **kwargs):
+        '''Constant power law source k0 * (E/e0)^index.
+
+        Parameter
+        ---------
+        irf_file : str
+            path to IRF in FITS format
+        offset : float
+            source offset from the pointing in degrees
+        rad : float
+            on region radius in degrees
+        erange : list
+            energy interval with [emin, emax] in TeV
+        k0 : float
+            prefactor in [ph/cm2/s/MeV]
+        index : float
+            powerlaw spectral index
+        e0 : float
+            pivot energy in MeV
+        **kwargs
+            alpha, nbin and pixel_size
+
+        Return
+        ------
+        asimov : AsimovCounts
+        '''
+        energies = np.array(erange, dtype=np.float64)
+        spectra = k0 * (energies * 1e6 / e0)**index
+        return cls(irf_file, offset, rad, erange, [-np.inf, np.inf], spectra[np.newaxis], energies, **kwargs)
+
+    @classmethod
+    def from_template(cls, irf_file, template, offset, rad, erange, ebl=False, scalefluxfactor=1, **kwargs):
+        '''Time variable source from a FITS template with energies [GeV], times [s] and spectra [ph/cm2/s/GeV] extensions, as read by RTACtoolsSimulation. Each spectrum holds over its time slice.
+
+        Parameter
+        ---------
+        irf_file : str
+            path to IRF in FITS format
+        template : str
+            path to the template in FITS format
+        offset : float
+            source offset from the pointing in degrees
+        rad : float
+            on region radius in degrees
+        erange : list
+            energy interval with [emin, emax] in TeV
+        ebl : bool
+            use the EBL absorbed spectra
+        scalefluxfactor : float
+            flux normalisation factor, the flux is divided by it
+        **kwargs
+            alpha, nbin and pixel_size
+
+        Return
+        ------
+        asimov : AsimovCounts
+        '''
+        with fits.open(template) as hdul:
+            energies = np.array(hdul[1].data.field(0), dtype=np.float64) / 1e3 # TeV
+            times = np.array(hdul[2].data.field(0), dtype=np.float64)
+            if ebl:
+                try:
+                    spectra = np.array(hdul[4].data.tolist(), dtype=np.float64)
+                except IndexError:
+                    raise IndexError('Template extensions out of range. Unable to load EBL absorbed spectra.')
+            else:
+                spectra = np.array(hdul[3].data.tolist(), dtype=np.float64)
+        # ph/cm2/s/GeV -> ph/cm2/s/MeV
+        spectra = spectra / 1e3 / scalefluxfactor
+        return cls(irf_file, offset, rad, erange, template_time_edges(times), spectra, energies, **kwargs)
+
+    def source_counts(self, tmin, tmax):
+        '''Expected source counts in the on region for each [tmin, tmax] window.
+
+        Parameter
+        ---------
+        tmin : float or array
+            windows start time in seconds
+        tmax : float or array
+            windows stop time in seconds
+
+        Return
+        ------
+        counts : ndarray
+            expected source counts for each window
+        '''
+        tmin, tmax = np.broadcast_arrays(np.asarray(tmin, dtype=np.float64), np.asarray(tmax, dtype=np.float64))
+        # overlap of every window with every time slice
+        overlap = np.minimum(tmax[..., np.newaxis], self.time_edges[1:]) - np.maximum(tmin[..., np.newaxis], self.time_edges[:-1])
+        return np.maximum(overlap, 0) @ self.source_rates
+
+    def background_counts(self, tmin, tmax):
+        '''Expected background counts in the on region for each [tmin, tmax] window.'''
+        return self.background_rate * np.maximum(np.asarray(tmax, dtype=np.float64) - np.asarray(tmin, dtype=np.float64), 0)
+
+    def photometry(self, tmin, tmax):
+        '''Asimov photometric results for each [tmin, tmax] window.
+
+        Parameter
+        ---------
+        tmin : float or array
+            windows start time in seconds
+        tmax : float or array
+            windows stop time in seconds
+
+        Return
+        ------
+        photometry : dict
+            expected source and background counts, with the Asimov on, off, alpha, excess and Li & Ma significance for each window
+        '''
+        source = self.source_counts(tmin, tmax)
+        background = self.background_counts(tmin, tmax)
+        on = source + background
+        off = background / self.alpha
+        return {'source': source, 'background': background, 'on': on, 'off': off, 'alpha': self.alpha, 'excess': get_excess_array(on, off, self.alpha), 'sigma': li_ma_array(on, off, self.alpha)}
+
+    def cumulative_photometry(self, start, times):
+        '''Asimov photometric results for cumulative windows [start, start+t].
+
+        Parameter
+        ---------
+        start : float
+            start time of the cumulative windows
+        times : list
+            exposure of each window
+
+        Return
+        ------
+        photometry : dict
+            expected source and background counts, with the Asimov on, off, alpha, excess and Li & Ma significance for each window
+        '''
+        times = np.asarray(times, dtype=float)
+        return self.photometry(np.full(times.shape, start), start + times)
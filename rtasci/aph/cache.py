@@ -0,0 +1,220 @@
+# *******************************************************************************
+# Copyright (C) 2021 INAF
+#
+# This software is distributed under the terms of the BSD-3-Clause license
+#
+# Authors:
+# Ambra Di Piano <ambra.dipiano@inaf.it>
+# Simone Tampieri <simone.tampieri@inaf.it>
+# *******************************************************************************
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+# environment variable with the path of the on-disk store of the default cache
+RESPONSE_CACHE_ENV = 'RTASCI_RESPONSE_CACHE'
+
+# version of the cached responses, to bump whenever their computation changes so that stored values are not served anymore
+RESPONSE_CACHE_VERSION = 2
+
+# IRF content hashes, keyed by (path, modification time, size) so that each file is read once
+_irf_hashes = {}
+
+def irf_content_hash(filename):
+    '''SHA1 of the IRF file content. The hash is computed once per file version.
+
+    Parameter
+    ---------
+    filename : str
+        path to IRF in FITS format
+
+    Return
+    ------
+    digest : str
+        hexadecimal SHA1 of the file content
+    '''
+    filename = os.path.realpath(os.path.expandvars(filename))
+    stat = os.stat(filename)
+    version = (filename, stat.st_mtime_ns, stat.st_size)
+    if version not in _irf_hashes:
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                sha1.update(chunk)
+        _irf_hashes[version] = sha1.hexdigest()
+    return _irf_hashes[version]
+
+class RegionResponseCache():
+    '''Memoization of region responses with an in-process LRU in front of an optional SQLite store. The store uses WAL journaling and a busy timeout, so pool workers can share the same file; each process opens its own connection. Both layers are bounded, the store evicts the least recently accessed entries.
+
+    Parameter
+    ---------
+    path : str or None
+        SQLite file of the on-disk store, None to keep the cache in memory only
+    maxsize : int
+        maximum number of entries of the in-process LRU
+    max_entries : int
+        maximum number of entries of the on-disk store
+    timeout : float
+        seconds to wait for a locked store
+    '''
+    def __init__(self, path=None, maxsize=1024, max_entries=100000, timeout=60.0):
+        self.path = os.path.expandvars(path) if path is not None else None
+        self.maxsize = maxsize
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.memory = OrderedDict()
+        self.connection = None
+        self.pid = None
+
+    def connect(self):
+        '''Open (once per process) the connection to the on-disk store.
+
+        Return
+        ------
+        connection : sqlite3.Connection or None
+            store connection, None for a memory only cache
+        '''
+        if self.path is None:
+            return None
+        # connections must not be shared with forked workers
+        if self.connection is None or self.pid != os.getpid():
+            dirname = os.path.dirname(self.path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value REAL NOT NULL, accessed REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+            self.pid = os.getpid()
+        return self.connection
+
+    @staticmethod
+    def make_key(irf_file, **parameters):
+        '''Build the cache key from the cache version, the IRF content and the parameters of the response.
+
+        Parameter
+        ---------
+        irf_file : str
+            path to IRF in FITS format
+        **parameters
+            float parameters of the response, rounded to 1e-9 to absorb floating point noise
+
+        Return
+        ------
+        key : str
+            cache key
+        '''
+        parameters = {k: round(float(v), 9) for k, v in parameters.items()}
+        return 'v{}:'.format(RESPONSE_CACHE_VERSION) + irf_content_hash(irf_file) + json.dumps(parameters, sort_keys=True)
+
+    def remember(self, key, value):
+        '''Store the value in the in-process LRU.'''
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        '''Look up a key, first in memory then on disk.
+
+        Parameter
+        ---------
+        key : str
+            cache key
+
+        Return
+        ------
+        value : float or None
+            cached value, None if missing
+        '''
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        connection = self.connect()
+        if connection is None:
+            return None
+        row = connection.execute('SELECT value FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+        self.remember(key, row[0])
+        return row[0]
+
+    def set(self, key, value):
+        '''Store a value in memory and on disk, evicting the least recently accessed entries beyond max_entries.
+
+        Parameter
+        ---------
+        key : str
+            cache key
+        value : float
+            value to store
+        '''
+        value = float(value)
+        self.remember(key, value)
+        connection = self.connect()
+        if connection is None:
+            return
+        connection.execute('INSERT OR REPLACE INTO responses (key, value, accessed) VALUES (?, ?, ?)', (key, value, time.time()))
+        excess = connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0] - self.max_entries
+        if excess > 0:
+            connection.execute('DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)', (excess,))
+
+    def get_or_compute(self, key, compute):
+        '''Return the cached value of key, computing and storing it if missing.
+
+        Parameter
+        ---------
+        key : str
+            cache key
+        compute : callable
+            function without arguments returning the value
+
+        Return
+        ------
+        value : float
+            cached or computed value
+        '''
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        '''Remove all entries from memory and disk.'''
+        self.memory.clear()
+        connection = self.connect()
+        if connection is not None:
+            connection.execute('DELETE FROM responses')
+
+_response_cache = None
+
+def get_response_cache():
+    '''Process-wide region response cache. Its on-disk store is the file named by the RTASCI_RESPONSE_CACHE environment variable, if set.
+
+    Return
+    ------
+    cache : RegionResponseCache
+        shared cache
+    '''
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = RegionResponseCache(path=os.environ.get(RESPONSE_CACHE_ENV))
+    return _response_cache
+
+def set_response_cache(cache):
+    '''Replace the process-wide region response cache, e.g. in pool initialisers.
+
+    Parameter
+    ---------
+    cache : RegionResponseCache
+        cache to share
+    '''
+    global _response_cache
+    _response_cache = cache
@@ -0,0 +1,200 @@
+# *******************************************************************************
+# Copyright (C) 2021 INAF
+#
+# This software is distributed under the terms of the BSD-3-Clause license
+#
+# Authors:
+# Ambra Di Piano <ambra.dipiano@inaf.it>
+# Simone Tampieri <simone.tampieri@inaf.it>
+# *******************************************************************************
+
+import numpy as np
+from rtasci.aph.utils import li_ma_array, get_excess_array
+from rtasci.aph.photometry import on_and_off_regions, region_membership
+
+def detection_times(times, on_weights, off_weights, alpha, thresholds=(3, 5)):
+    '''Find the first time the cumulative Li & Ma significance crosses each threshold. The significance is evaluated after every event arrival, so the result has the resolution of a single event. Only positive excesses count as detections.
+
+    Parameter
+    ---------
+    times : array
+        time-ordered events arrival times
+    on_weights : array
+        on region membership of each event
+    off_weights : array
+        number of off regions containing each event
+    alpha : float
+        alpha parameter
+    thresholds : list
+        significance thresholds in gaussian sigmas
+
+    Return
+    ------
+    detections : dict
+        first crossing time for each threshold, NaN if never reached
+    '''
+    times = np.asarray(times)
+    cumulative_on = np.cumsum(on_weights)
+    cumulative_off = np.cumsum(off_weights)
+    sigma = li_ma_array(cumulative_on, cumulative_off, alpha)
+    sigma[get_excess_array(cumulative_on, cumulative_off, alpha) <= 0] = np.nan
+    detections = {}
+    for threshold in thresholds:
+        crossed = sigma >= threshold
+        detections[threshold] = times[np.argmax(crossed)] if crossed.any() else np.nan
+    return detections
+
+class CumulativeCounts():
+    '''Prefix-sum engine for on/off aperture photometry over many time windows. The events of a trial are assigned to the on and off regions once, then the cumulative counts along TIME answer any list of [tmin, tmax] windows with two binary searches per window.
+
+    Parameter
+    ---------
+    phm : Photometrics
+        photometry object holding the events of the trial
+    src : dict or tuple or list
+        on region center coordinates with (ra, dec) in degrees
+    rad : float
+        on region radius in degrees
+    off_regions : list
+        list of regions dictionary with ra, dec, rad in degrees
+    emin : float or None
+        minimum energy selection cut
+    emax : float or None
+        maximum energy selection cut
+    '''
+    def __init__(self, phm, src, rad, off_regions, emin=None, emax=None):
+        if len(off_regions) == 0:
+            raise Exception('need at least one off region')
+        index = phm.events_index
+        if index.times is None:
+            raise Exception("Events data has no 'TIME' col")
+        window = index.time_slice()
+        vectors = index.vectors
+        times = index.times
+        mask = index.energy_mask(window, emin=emin, emax=emax)
+        if mask is not None:
+            vectors = vectors[mask]
+            times = times[mask]
+        membership = region_membership(vectors, on_and_off_regions(src, rad, off_regions))
+        self.times = times
+        self.alpha = 1 / len(off_regions)
+        # an event inside overlapping off regions is counted once per region, as in counting()
+        self.on_weights = membership[:, 0].astype(np.int64)
+        self.off_weights = np.count_nonzero(membership[:, 1:], axis=1)
+        self.cumulative_on = np.concatenate(([0], np.cumsum(self.on_weights)))
+        self.cumulative_off = np.concatenate(([0], np.cumsum(self.off_weights)))
+
+    def window_edges(self, tmin, tmax):
+        '''Resolve [tmin, tmax] windows (both edges included) into events index ranges.
+
+        Parameter
+        ---------
+        tmin : float or array
+            windows start time
+        tmax : float or array
+            windows stop time
+
+        Return
+        ------
+        start : ndarray
+            index of the first event of each window
+        stop : ndarray
+            index after the last event of each window
+        '''
+        start = np.searchsorted(self.times, tmin, side='left')
+        stop = np.maximum(np.searchsorted(self.times, tmax, side='right'), start)
+        return start, stop
+
+    def counts(self, tmin, tmax):
+        '''On and off counts for each [tmin, tmax] window.
+
+        Parameter
+        ---------
+        tmin : float or array
+            windows start time
+        tmax : float or array
+            windows stop time
+
+        Return
+        ------
+        on : ndarray
+            on counts for each window
+        off : ndarray
+            off counts for each window
+        '''
+        start, stop = self.window_edges(tmin, tmax)
+        on = self.cumulative_on[stop] - self.cumulative_on[start]
+        off = self.cumulative_off[stop] - self.cumulative_off[start]
+        return on, off
+
+    def photometry(self, tmin, tmax):
+        '''Photometric results for each [tmin, tmax] window.
+
+        Parameter
+        ---------
+        tmin : float or array
+            windows start time
+        tmax : float or array
+            windows stop time
+
+        Return
+        ------
+        photometry : dict
+            on, off, alpha, excess and Li & Ma significance for each window
+        '''
+        on, off = self.counts(tmin, tmax)
+        excess = get_excess_array(on, off, self.alpha)
+        sigma = li_ma_array(on, off, self.alpha)
+        return {'on': on, 'off': off, 'alpha': self.alpha, 'excess': excess, 'sigma': sigma}
+
+    def cumulative_photometry(self, start, times):
+        '''Photometric results for cumulative windows [start, start+t].
+
+        Parameter
+        ---------
+        start : float
+            start time of the cumulative windows
+        times : list
+            exposure of each window
+
+        Return
+        ------
+        photometry : dict
+            on, off, alpha, excess and Li & Ma significance for each window
+        '''
+        times = np.asarray(times, dtype=float)
+        return self.photometry(np.full(times.shape, start), start + times)
+
+    def lightcurve_photometry(self, edges):
+        '''Photometric results for consecutive lightcurve bins [edges[i], edges[i+1]].
+
+        Parameter
+        ---------
+        edges : list
+            lightcurve bins edges
+
+        Return
+        ------
+        photometry : dict
+            on, off, alpha, excess and Li & Ma significance for each bin
+        '''
+        edges = np.asarray(edges, dtype=float)
+        return self.photometry(edges[:-1], edges[1:])
+
+    def detection_times(self, start=None, thresholds=(3, 5)):
+        '''Find the first time the cumulative significance from start crosses each threshold.
+
+        Parameter
+        ---------
+        start : float or None
+            start time of the cumulative exposure, None to start from the first event
+        thresholds : list
+            significance thresholds in gaussian sigmas
+
+        Return
+        ------
+        detections : dict
+            first crossing time for each threshold, NaN if never reached
+        '''
+        first = 0 if start is None else int(np.searchsorted(self.times, start, side='left'))
+        return detection_times(self.times[first:], self.on_weights[first:], self.off_weights[first:], self.alpha, thresholds=thresholds)
@@ -0,0 +1,205 @@
+# *******************************************************************************
+# Copyright (C) 2021 INAF
+#
+# This software is distributed under the terms of the BSD-3-Clause license
+#
+# Authors:
+# Ambra Di Piano <ambra.dipiano@inaf.it>
+# Simone Tampieri <simone.tampieri@inaf.it>
+# *******************************************************************************
+
+import numpy as np
+from rtasci.aph.utils import li_ma_array, get_excess_array
+from rtasci.aph.photometry import Photometrics, on_and_off_regions, region_membership, unit_vectors
+
+class EnsemblePhotometry():
+    '''On/off aperture photometry of many independent trials sharing the same geometry. The events of all trials are concatenated and assigned to the regions once, then every table of counts over (trial, region, window) is filled with a single np.bincount.
+
+    Parameter
+    ---------
+    events : list or np.recarray
+        list of events arrays, one per trial, or a single concatenated events array
+    src : dict or tuple or list
+        on region center coordinates with (ra, dec) in degrees
+    rad : float
+        on region radius in degrees
+    off_regions : list
+        list of regions dictionary with ra, dec, rad in degrees
+    trial_ids : array or str or None
+        trial of each event, or the name of the events column holding it, for a concatenated events array
+    emin : float or None
+        minimum energy selection cut
+    emax : float or None
+        maximum energy selection cut
+    '''
+    def __init__(self, events, src, rad, off_regions, trial_ids=None, emin=None, emax=None):
+        if len(off_regions) == 0:
+            raise Exception('need at least one off region')
+        if isinstance(events, (list, tuple)):
+            if trial_ids is not None:
+                raise Exception('trial_ids is only allowed with a single concatenated events array')
+            lengths = [len(e) for e in events]
+            ids = np.repeat(np.arange(len(events)), lengths)
+            self.trials = np.arange(len(events))
+            columns = {col: np.concatenate([np.asarray(e[col]) for e in events]) if len(events) else np.empty(0) for col in ('RA', 'DEC', 'ENERGY', 'TIME')}
+        else:
+            if trial_ids is None:
+                raise Exception('need trial_ids for a single concatenated events array')
+            if isinstance(trial_ids, str):
+                trial_ids = events[trial_ids]
+            self.trials, ids = np.unique(np.asarray(trial_ids), return_inverse=True)
+            columns = {col: np.asarray(events[col]) for col in ('RA', 'DEC', 'ENERGY', 'TIME')}
+        mask = np.full(len(ids), True)
+        if emin is not None:
+            mask &= columns['ENERGY'] >= emin
+        if emax is not None:
+            mask &= columns['ENERGY'] <= emax
+        regions = on_and_off_regions(src, rad, off_regions)
+        membership = region_membership(unit_vectors(columns['RA'][mask], columns['DEC'][mask]), regions)
+        # keep only the (event, region) pairs with a hit
+        events_index, self.region_index = np.nonzero(membership)
+        self.times = columns['TIME'][mask][events_index].astype(np.float64)
+        self.trial_index = ids[mask][events_index]
+        self.n_regions = len(regions)
+        self.alpha = 1 / len(off_regions)
+
+    @classmethod
+    def from_files(cls, filenames, src, rad, off_regions, emin=None, emax=None):
+        '''Build the ensemble from one events file per trial.
+
+        Parameter
+        ---------
+        filenames : list
+            events FITS files, one per trial
+        src : dict or tuple or list
+            on region center coordinates with (ra, dec) in degrees
+        rad : float
+            on region radius in degrees
+        off_regions : list
+            list of regions dictionary with ra, dec, rad in degrees
+        emin : float or None
+            minimum energy selection cut
+        emax : float or None
+            maximum energy selection cut
+
+        Return
+        ------
+        ensemble : EnsemblePhotometry
+        '''
+        events = [Photometrics.load_data_from_fits_files([f]) for f in filenames]
+        return cls(events, src, rad, off_regions, emin=emin, emax=emax)
+
+    def cumulative_region_counts(self, edges, side):
+        '''Counts of each (trial, region) up to each time edge.
+
+        Parameter
+        ---------
+        edges : ndarray
+            sorted time edges
+        side : str
+            "right" to count events with TIME <= edge, "left" for TIME < edge
+
+        Return
+        ------
+        counts : ndarray
+            integer counts with shape (trials, regions, edges)
+        '''
+        # an event is counted by all the edges from its first one on
+        first = np.searchsorted(edges, self.times, side='left' if side == 'right' else 'right')
+        nedges = len(edges) + 1
+        bins = (self.trial_index * self.n_regions + self.region_index) * nedges + first
+        counts = np.bincount(bins, minlength=len(self.trials) * self.n_regions * nedges)
+        return np.cumsum(counts.reshape(len(self.trials), self.n_regions, nedges), axis=2)[:, :, :-1]
+
+    def region_counts(self, tmin, tmax):
+        '''Counts of each trial and region for each [tmin, tmax] window (both edges included).
+
+        Parameter
+        ---------
+        tmin : float or array
+            windows start time
+        tmax : float or array
+            windows stop time
+
+        Return
+        ------
+        counts : ndarray
+            integer counts with shape (trials, regions, windows)
+        '''
+        tmin, tmax = np.broadcast_arrays(np.atleast_1d(np.asarray(tmin, dtype=float)), np.atleast_1d(np.asarray(tmax, dtype=float)))
+        edges, inverse = np.unique(np.concatenate((tmin, tmax)), return_inverse=True)
+        start, stop = inverse[:len(tmin)], inverse[len(tmin):]
+        counts = self.cumulative_region_counts(edges, 'right')[:, :, stop] - self.cumulative_region_counts(edges, 'left')[:, :, start]
+        return np.maximum(counts, 0)
+
+    def counts(self, tmin, tmax):
+        '''On and off counts of each trial for each [tmin, tmax] window.
+
+        Parameter
+        ---------
+        tmin : float or array
+            windows start time
+        tmax : float or array
+            windows stop time
+
+        Return
+        ------
+        on : ndarray
+            on counts with shape (trials, windows)
+        off : ndarray
+            off counts with shape (trials, windows)
+        '''
+        counts = self.region_counts(tmin, tmax)
+        return counts[:, 0], counts[:, 1:].sum(axis=1)
+
+    def photometry(self, tmin, tmax):
+        '''Photometric results tables of each trial for each [tmin, tmax] window.
+
+        Parameter
+        ---------
+        tmin : float or array
+            windows start time
+        tmax : float or array
+            windows stop time
+
+        Return
+        ------
+        photometry : dict
+            trials ids and on, off, alpha, excess and Li & Ma significance with shape (trials, windows)
+        '''
+        on, off = self.counts(tmin, tmax)
+        return {'trials': self.trials, 'on': on, 'off': off, 'alpha': self.alpha, 'excess': get_excess_array(on, off, self.alpha), 'sigma': li_ma_array(on, off, self.alpha)}
+
+    def cumulative_photometry(self, start, times):
+        '''Photometric results tables for cumulative windows [start, start+t].
+
+        Parameter
+        ---------
+        start : float
+            start time of the cumulative windows
+        times : list
+            exposure of each window
+
+        Return
+        ------
+        photometry : dict
+            trials ids and on, off, alpha, excess and Li & Ma significance with shape (trials, windows)
+        '''
+        times = np.asarray(times, dtype=float)
+        return self.photometry(np.full(times.shape, start), start + times)
+
+    def lightcurve_photometry(self, edges):
+        '''Photometric results tables for consecutive lightcurve bins [edges[i], edges[i+1]].
+
+        Parameter
+        ---------
+        edges : list
+            lightcurve bins edges
+
+        Return
+        ------
+        photometry : dict
+            trials ids and on, off, alpha, excess and Li & Ma significance with shape (trials, bins)
+        '''
+        edges = np.asarray(edges, dtype=float)
+        return self.photometry(edges[:-1], edges[1:])
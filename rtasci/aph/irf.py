@@ -16,13 +16,92 @@
 #    Gabriele Panebianco <gabriele.panebianco3@unibo.it>
 # *****************************************************************************
 
+import os
 import math
 import numpy as np
+from collections import OrderedDict
 from scipy import interpolate, integrate
 from rtasci.aph import utils 
+from rtasci.aph.cache import get_response_cache, irf_content_hash
 from astropy.coordinates import SkyCoord
 from astropy.io import fits
 
+def bin_indexes(bins, values, message='Value is out of range ({})'):
+    """Locate values in [LO, HI) bins via binary search.
+
+    Parameter
+    ---------
+    bins : ndarray
+        bins edges with shape (N, 2) given as [LO, HI], sorted and contiguous
+    values : float or array
+        values to locate
+    message : str
+        exception message for values outside the bins
+
+    Return
+    ------
+    index : ndarray
+        bin index of each value
+    """
+    bins = np.asarray(bins, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    index = np.searchsorted(bins[:, 0], values, side='right') - 1
+    outside = (index < 0) | (values >= bins[np.clip(index, 0, len(bins) - 1), 1])
+    if np.any(outside):
+        raise Exception(message.format(values[outside] if values.ndim else values))
+    return index
+
+def nearest_bin_index(centers, values):
+    """Index of the nearest bin center to each value, ties go to the lower center.
+
+    Parameter
+    ---------
+    centers : ndarray
+        sorted bins centers
+    values : float or array
+        values to locate
+
+    Return
+    ------
+    index : ndarray
+        index of the nearest center
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(centers) == 1:
+        return np.zeros(values.shape, dtype=np.intp)
+    upper = np.clip(np.searchsorted(centers, values, side='left'), 1, len(centers) - 1)
+    lower = upper - 1
+    return np.where(np.abs(centers[upper] - values) < np.abs(values - centers[lower]), upper, lower)
+
+def interpolate_rows(x, matrix, rows, values):
+    """Linear interpolation of values along the x axis, each value on its own row of matrix. Values outside the x range raise as interp1d did.
+
+    Parameter
+    ---------
+    x : ndarray
+        sorted abscissae of the matrix columns
+    matrix : ndarray
+        ordinates with shape (rows, len(x), ...)
+    rows : ndarray
+        row of each value
+    values : ndarray
+        abscissae to interpolate, broadcast against rows
+
+    Return
+    ------
+    interpolated : ndarray
+        interpolated ordinates
+    """
+    rows, values = np.broadcast_arrays(np.asarray(rows), np.asarray(values, dtype=np.float64))
+    if np.any((values < x[0]) | (values > x[-1])):
+        raise ValueError('A value in x_new is out of the interpolation range.')
+    upper = np.clip(np.searchsorted(x, values, side='left'), 1, len(x) - 1)
+    weight = (values - x[upper - 1]) / (x[upper] - x[upper - 1])
+    low, high = matrix[rows, upper - 1], matrix[rows, upper]
+    weight = weight.reshape(weight.shape + (1,) * (low.ndim - weight.ndim))
+    return low + (high - low) * weight
+
 class IRF:
     """Class that allows to operate on the Instrument Response Functions in FITS format.
     
@@ -88,10 +167,11 @@ class EffectiveArea:
         self.energies = None
         self.thetas = None
         self.aeff_matrix = None
+        self.aeff_interpolator = None
         # check path
         if irf_filename is not None:
             self.irf_filename = irf_filename
-            irf = IRF(self.irf_filename)
+            irf = get_irf(self.irf_filename).irf
             self.eff_area = irf.get_eff_area()
         # check extension
         elif eff_area_bintable is not None:
@@ -101,6 +181,7 @@ class EffectiveArea:
             raise Exception('Need an irf or effective area bintable')
         # get data
         self.get_data_matrices()
+        self.get_aeff_interpolator()
 
     def columns(self):
         """Get FITS extension columns.
@@ -153,6 +234,26 @@ class EffectiveArea:
             self.thetas = np.column_stack((data.field('THETA_LO')[0], data.field('THETA_HI')[0]))
         return self.aeff_matrix, self.energies, self.thetas
 
+    def aeff_1d_log(self, offsets, energies):
+        """Compute the effective area in [m2] via 1d interpolation on log energy within the theta bin of each offset, for broadcast arrays of offsets and energies.
+
+        Parameters
+        ----------
+        offsets : float or array
+            offsets from the pointing in degrees
+        energies : float or array
+            energies in [TeV]
+
+        Return
+        ------
+        aeff : ndarray
+            effective area values in [m2]
+        """
+        aeff_matrix, energy_bins, theta_bins = self.get_data_matrices()
+        theta_index = bin_indexes(theta_bins, offsets, 'Theta offset is out of range ({})')
+        energy_mid = np.mean(np.log10(energy_bins, dtype=np.float64), axis=1)
+        return interpolate_rows(energy_mid, np.asarray(aeff_matrix, dtype=np.float64), theta_index, np.log10(energies))
+
     def get_aeff_1d_log(self, offset, energy):
         """Compute the effective area in [m2] via 1d interpolation on energy.
 
@@ -169,20 +270,45 @@ class EffectiveArea:
             effective area value in [m2]
         """
         offset_angle = utils.get_angle(offset)
-        aeff_matrix, energy_bins, theta_bins = self.get_data_matrices()
+        return self.aeff_1d_log(offset_angle.degree, energy)
 
-        theta_index = None
-        for i, tb in enumerate(theta_bins):
-            if offset_angle.degree >= tb[0] and offset_angle.degree < tb[1]:
-                theta_index = i
-                break
-        if theta_index is None:
-            raise Exception('Theta offset is out of range ({})'.format(offset))
+    def get_aeff_interpolator(self):
+        """Build (once) the bilinear interpolator of the effective area on the grid of theta and log10 energy bins centers.
 
-        # energy interpolation
-        energy_mid = [ (e[0]+e[1])/2 for e in np.log10(energy_bins) ]
-        energy_fn  = interpolate.interp1d(x = energy_mid, y = aeff_matrix[theta_index])
-        return energy_fn(np.log10(energy))
+        Parameter
+        ---------
+
+        Return
+        ------
+        interpolator : RegularGridInterpolator
+            effective area interpolator over (theta, log10 energy)
+        """
+        if self.aeff_interpolator is None:
+            aeff_matrix, energy_bins, theta_bins = self.get_data_matrices()
+            self.theta_mid = np.mean(theta_bins, axis=1, dtype=np.float64)
+            self.log_energy_mid = np.mean(np.log10(energy_bins, dtype=np.float64), axis=1)
+            self.aeff_interpolator = interpolate.RegularGridInterpolator((self.theta_mid, self.log_energy_mid), np.asarray(aeff_matrix, dtype=np.float64), method='linear')
+        return self.aeff_interpolator
+
+    def aeff(self, offsets, energies):
+        """Compute the effective area in [m²] via 2d interpolation on thetas and log energy, broadcasting offsets against energies. Values outside the grid hold the edge value, as interp2d did.
+
+        Parameters
+        ----------
+        offsets : float or array
+            offsets from the pointing in degrees
+        energies : float or array
+            energies in [TeV]
+
+        Return
+        ------
+        aeff : ndarray
+            effective area values in [m2] with the broadcast shape of offsets and energies
+        """
+        interpolator = self.get_aeff_interpolator()
+        offsets, log_energies = np.broadcast_arrays(np.asarray(offsets, dtype=np.float64), np.log10(np.asarray(energies, dtype=np.float64)))
+        points = np.stack((np.clip(offsets, self.theta_mid[0], self.theta_mid[-1]).ravel(), np.clip(log_energies, self.log_energy_mid[0], self.log_energy_mid[-1]).ravel()), axis=-1)
+        return interpolator(points).reshape(offsets.shape)
 
     def get_aeff_2d_log(self, input_offset, input_energy):
         """Compute the effective area in [m²] via 2d interpolation on thetas and energy.
@@ -200,13 +326,7 @@ class EffectiveArea:
             effective area value in [m2]
         """
         offset_angle = utils.get_angle(input_offset)
-        aeff_matrix, energy_bins, theta_bins = self.get_data_matrices()
-
-        # energy interpolation
-        theta_mid  = [ (t[0]+t[1])/2 for t in theta_bins ]
-        energy_mid = [ (e[0]+e[1])/2 for e in np.log10(energy_bins) ]
-        energy_fn  = interpolate.interp2d(x = energy_mid, y = theta_mid, z = aeff_matrix)
-        return energy_fn(np.log10(input_energy), input_offset)[0]
+        return float(self.aeff(offset_angle.degree, input_energy))
 
     def weighted_value_for_region(self, *args):
         """Compute the effective response value weighter over the photometric region.
@@ -246,37 +366,20 @@ class EffectiveArea:
         if len(input_energies) != 2:
             raise Exception('need two energies')
 
-        psf = PSF(irf_filename=self.irf_filename)
+        psf = get_irf(self.irf_filename).psf()
 
-        # create a grid of points
-        points = self.create_pixel_map(region, pixel_size)
-        # select the points inside the region
-        internal_points = self.select_points_in_region(points, region)
-        # calculate the offsets
-        offsets = self.get_thetas(pointing, internal_points)
+        # offsets of the pixels inside the region
+        offsets = self.region_offsets(region, pointing, pixel_size)
+        # powerlaw weights of the energy steps
+        energies_middle, i_factor = self.powerlaw_energy_weights(input_energies, e_index)
 
-        log_energies = np.log10(input_energies)
-        # N steps for every unit of log energy
-        steps = int(np.ceil(log_energies[1]-log_energies[0]) * 10)
-        energies = 10**np.linspace(log_energies[0], log_energies[1], steps)
-        powerlaw = lambda x: x**e_index
-        i_full = integrate.quad(powerlaw, input_energies[0], input_energies[1])
-        i_partials = [ integrate.quad(powerlaw, energies[i], energies[i+1]) for i,v in enumerate(energies[:-1]) ]
-        i_factor = [ p[0]/i_full[0] for p in i_partials ]
-        energies_middle = (energies[1:]+energies[:-1])/2
-
-        psf_engines = {}
-        for en in energies_middle:
-            psf_engines[en] = psf.get_psf_engine(region, pointing, en)
-        region_radius_rad = np.deg2rad(region['rad'])
+        # psf containment within the region for the region center offset
+        theta = self.get_offsets(pointing, [float(region['ra'])], [float(region['dec'])])[0]
+        psf_rates = psf.containment(theta, energies_middle, float(region['rad']))
 
         n_points = len(offsets)
-        val = 0
-        for t in offsets:
-            for i, en in enumerate(energies_middle):
-                psf_rate = psf_engines[en](0, region_radius_rad)[0]
-                val += self.get_aeff_2d_log(t, en) * i_factor[i] * psf_rate / n_points
-        return val
+        aeff = self.aeff(offsets[:, np.newaxis], energies_middle[np.newaxis, :])
+        return np.sum(aeff * i_factor * psf_rates) / n_points
 
     def weighted_value_for_region_w_powerlaw(self, region, pointing, input_energies, pixel_size=0.05, e_index=-2.4):
         """Compute the effective area value in [m²] for a specific region. This method uses the energy range to evaluate the AEFF. The energy range is binned and weighted with a powerlaw with index. Each pixel has a radial weigth and a specific column of energies weight. Lower energies have more weigth than higher. If the energy range is small, the effect is trascurable similarly to weighted_value_for_region_single_energy method.
@@ -302,28 +405,13 @@ class EffectiveArea:
         if len(input_energies) != 2:
             raise Exception('need two energies')
 
-        # create a grid of points
-        points = self.create_pixel_map(region, pixel_size)
-        # select the points inside the region
-        internal_points = self.select_points_in_region(points, region)
-        # calculate the offsets
-        offsets = self.get_thetas(pointing, internal_points)
-
-        log_energies = np.log10(input_energies)
-        # N steps for every unit of log energy
-        steps = int(np.ceil(log_energies[1]-log_energies[0]) * 10)
-        energies = 10**np.linspace(log_energies[0], log_energies[1], steps)
-        powerlaw = lambda x: x**e_index
-        i_full = integrate.quad(powerlaw, input_energies[0], input_energies[1])
-        i_partials = [ integrate.quad(powerlaw, energies[i], energies[i+1]) for i,v in enumerate(energies[:-1]) ]
-        i_factor = [ p[0]/i_full[0] for p in i_partials ]
-        energies_middle = (energies[1:]+energies[:-1])/2
+        # offsets of the pixels inside the region
+        offsets = self.region_offsets(region, pointing, pixel_size)
+        # powerlaw weights of the energy steps
+        energies_middle, i_factor = self.powerlaw_energy_weights(input_energies, e_index)
         n_points = len(offsets)
-        val = 0
-        for t in offsets:
-            for i, en in enumerate(energies_middle):
-                val += self.get_aeff_2d_log(t, en) * i_factor[i] / n_points
-        return val
+        aeff = self.aeff(offsets[:, np.newaxis], energies_middle[np.newaxis, :])
+        return np.sum(aeff * i_factor) / n_points
 
     def weighted_value_for_region_no_powerlaw(self, region, pointing, input_energies, pixel_size=0.05):
         """Compute the effective area value [m²] for a specific region. This method use an energy range to evaluate the aeff. The energy range is binned and every matrix cube (pixel distance * energy bin) have the same weight. No powerlaw is considered. 
@@ -347,23 +435,11 @@ class EffectiveArea:
         if len(input_energies) != 2:
             raise Exception('need two energies')
 
-        # create a grid of points
-        points = self.create_pixel_map(region, pixel_size)
-        # select the points inside the region
-        internal_points = self.select_points_in_region(points, region)
-        # calculate the offsets
-        offsets = self.get_thetas(pointing, internal_points)
-
-        log_energies = np.log10(input_energies)
-        diff = np.ceil(log_energies[1]-log_energies[0])
-        steps = int(diff * 10) # N steps for every unit of log energy
-        energies = 10**np.linspace(log_energies[0], log_energies[1], steps)
+        # offsets of the pixels inside the region
+        offsets = self.region_offsets(region, pointing, pixel_size)
+        energies = self.energy_steps(input_energies)
         n_points = len(offsets) * len(energies)
-        val = 0
-        for t in offsets:
-            for en in energies:
-                val += self.get_aeff_2d_log(t, en) / n_points
-        return val
+        return np.sum(self.aeff(offsets[:, np.newaxis], energies[np.newaxis, :])) / n_points
 
     def weighted_value_for_region_single_energy(self, region, pointing, energy, pixel_size=0.05):
         """Compute the effective area value [m²] for a specific region. This method is just a plain output from an array of points and one energy (usually the middle point of the energy range. DEPRECATED.
@@ -384,33 +460,116 @@ class EffectiveArea:
         val : float
             effective area value in [m2]
         """
-        # create a grid of points
-        points = self.create_pixel_map(region, pixel_size)
-        # select the points inside the region
-        internal_points = self.select_points_in_region(points, region)
-        # calculate the offsets
-        offsets = self.get_thetas(pointing, internal_points)
+        # offsets of the pixels inside the region
+        offsets = self.region_offsets(region, pointing, pixel_size)
 
         n_points = len(offsets)
-        val = 0
-        for t in offsets:
-            val += self.get_aeff_2d_log(t, energy) / n_points
-        return val # m2
+        return np.sum(self.aeff(offsets, energy)) / n_points # m2
 
     # helpers
     @staticmethod
-    def create_pixel_map(region, pixel_side):
-        """Compute the map pixel grid shifting from side to center.
+    def energy_steps(input_energies):
+        """Split the energy range in log steps, 10 steps for every (started) unit of log energy.
 
-        Paramter
-        --------
-        pixel_side : array
-            edges of pixels
+        Parameter
+        ---------
+        input_energies : list
+            energy interval in [TeV] given as [emin, emax]
 
         Return
         ------
-        pixels_midpoint : list
-            centers of pixels
+        energies : ndarray
+            energy steps edges in [TeV]
+        """
+        log_energies = np.log10(input_energies)
+        steps = int(np.ceil(log_energies[1]-log_energies[0]) * 10)
+        return 10**np.linspace(log_energies[0], log_energies[1], steps)
+
+    @staticmethod
+    def powerlaw_integral(e_lo, e_hi, e_index):
+        """Analytic integral of the powerlaw E^index between e_lo and e_hi.
+
+        Parameter
+        ---------
+        e_lo : float or array
+            lower integration bound in [TeV]
+        e_hi : float or array
+            upper integration bound in [TeV]
+        e_index : float
+            powerlaw spectral index
+
+        Return
+        ------
+        integral : float or ndarray
+            powerlaw integral
+        """
+        if e_index == -1:
+            return np.log(e_hi / e_lo)
+        return (e_hi**(e_index+1) - e_lo**(e_index+1)) / (e_index+1)
+
+    def powerlaw_energy_weights(self, input_energies, e_index=-2.4):
+        """Energy steps middle points and the fraction of the powerlaw integral within each step.
+
+        Parameter
+        ---------
+        input_energies : list
+            energy interval in [TeV] given as [emin, emax]
+        e_index : float
+            powerlaw spectral index
+
+        Return
+        ------
+        energies_middle : ndarray
+            middle point of each energy step in [TeV]
+        weights : ndarray
+            powerlaw weight of each energy step
+        """
+        energies = self.energy_steps(input_energies)
+        i_full = self.powerlaw_integral(input_energies[0], input_energies[1], e_index)
+        weights = self.powerlaw_integral(energies[:-1], energies[1:], e_index) / i_full
+        energies_middle = (energies[1:]+energies[:-1])/2
+        return energies_middle, weights
+
+    def region_offsets(self, region, pointing, pixel_size):
+        """Offsets from the pointing of the centers of the pixels inside the region.
+
+        Parameter
+        ---------
+        region : dict
+            region dictionary with ra, dec, rad in degrees
+        pointing : dict
+            pointing dictionary with ra, dec in degrees
+        pixel_size : float
+            size of a pixel in degrees
+
+        Return
+        ------
+        offsets : ndarray
+            offsets in degrees
+        """
+        ra, dec = self.pixel_grid(region, pixel_size)
+        inside = self.points_in_region(ra, dec, region)
+        if not inside.any():
+            raise Exception('need at least 1 point to check')
+        return self.get_offsets(pointing, ra[inside], dec[inside])
+
+    @staticmethod
+    def pixel_grid(region, pixel_side):
+        """Compute the centers of a square grid of pixels around the region center.
+
+        Parameter
+        ---------
+        region : dict
+            region dictionary with ra, dec, rad in degrees
+        pixel_side : float
+            pixel side in degrees
+
+        Return
+        ------
+        ra : ndarray
+            pixels centers right ascension in degrees
+        dec : ndarray
+            pixels centers declination in degrees
         """
         for k in ['ra', 'dec', 'rad']:
             if k in region:
@@ -421,39 +580,57 @@ class EffectiveArea:
         if pixel_side <= 0:
             raise Exception('pixel side must be > 0')
 
-        region_center = { 'ra': float(region['ra']), 'dec': float(region['dec']) }
-        region_rad = utils.get_angle(float(region['rad']))
-        pixel_side_angle = utils.get_angle(float(pixel_side))
-
         # +10% to get a bit of margin
-        n_pixel_on_rad = 1.1* region_rad / pixel_side_angle
+        n_pixel_on_rad = 1.1 * float(region['rad']) / float(pixel_side)
         if n_pixel_on_rad <= 1:
             n_pixel_on_rad = 1
 
         n_pixel_on_axis = float(math.ceil(n_pixel_on_rad))
         multipliers = np.arange(-1*n_pixel_on_axis, n_pixel_on_axis+1)
-        pixels_midpoint = []
-        for i in multipliers:
-            for j in multipliers:
-                pixels_midpoint.append({ 'ra':  region_center['ra']  + i * pixel_side_angle.deg,
-                                         'dec': region_center['dec'] + j * pixel_side_angle.deg })
-        return pixels_midpoint
+        # same ordering as create_pixel_map: ra outer, dec inner
+        i, j = np.meshgrid(multipliers, multipliers, indexing='ij')
+        return float(region['ra']) + i.ravel() * float(pixel_side), float(region['dec']) + j.ravel() * float(pixel_side)
 
     @staticmethod
-    def select_points_in_region(midpoints, region):
-        """Select pixels within region.
+    def angular_separation(ra1, dec1, ra2, dec2):
+        """Vincenty angular separation in degrees, as astropy separation.
 
         Parameter
         ---------
-        midpoints : array
-            center point of pixels
+        ra1, dec1 : float or array
+            first coordinates in degrees
+        ra2, dec2 : float or array
+            second coordinates in degrees
+
+        Return
+        ------
+        separation : ndarray
+            angular separation in degrees
+        """
+        ra1, dec1, ra2, dec2 = [np.deg2rad(np.asarray(c, dtype=np.float64)) for c in (ra1, dec1, ra2, dec2)]
+        dra = ra2 - ra1
+        num1 = np.cos(dec2) * np.sin(dra)
+        num2 = np.cos(dec1) * np.sin(dec2) - np.sin(dec1) * np.cos(dec2) * np.cos(dra)
+        denominator = np.sin(dec1) * np.sin(dec2) + np.cos(dec1) * np.cos(dec2) * np.cos(dra)
+        return np.rad2deg(np.arctan2(np.hypot(num1, num2), denominator))
+
+    @classmethod
+    def points_in_region(cls, ra, dec, region):
+        """Mask of the points within region.
+
+        Parameter
+        ---------
+        ra : array
+            points right ascension in degrees
+        dec : array
+            points declination in degrees
         region : dict
             region dictionary with ra, dec, rad in degrees
 
         Return
         ------
-        midpoints : array
-            selected array of midpoints within region
+        mask : ndarray
+            True for the points within the region
         """
         for k in ['ra', 'dec', 'rad']:
             if k in region:
@@ -461,22 +638,75 @@ class EffectiveArea:
             raise Exception('region data missing {} mandatory key.'.format(k))
         if region['rad'] <= 0:
             raise Exception('region radius must be > 0')
-        if len(midpoints) < 1:
+        if len(ra) < 1:
             raise Exception('need at least 1 point to check')
+        return cls.angular_separation(float(region['ra']), float(region['dec']), ra, dec) < float(region['rad'])
 
-        region_center = utils.get_skycoord(region)
-        region_radius = utils.get_angle(region['rad'])
-        midpoints_ra = []
-        midpoints_dec = []
-        for p in midpoints:
-            midpoints_ra.append(p['ra'])
-            midpoints_dec.append(p['dec'])
-        midpoints_coords = SkyCoord(midpoints_ra, midpoints_dec, unit='deg', frame='icrs')
-        distances = region_center.separation(midpoints_coords)
-        return np.extract(distances < region_radius, midpoints)
+    @classmethod
+    def get_offsets(cls, point, ra, dec):
+        """Get separations of points from a center.
 
-    @staticmethod
-    def get_thetas(point, midpoints):
+        Parameter
+        ---------
+        point : dict
+            center with ra, dec in degrees
+        ra : array
+            points right ascension in degrees
+        dec : array
+            points declination in degrees
+
+        Return
+        ------
+        offsets : ndarray
+            separation of points from center in degrees
+        """
+        for k in ['ra', 'dec']:
+            if k in point:
+                continue
+            raise Exception('point coord {} is missing.'.format(k))
+        if len(ra) < 1:
+            raise Exception('need at least 1 point to check')
+        return cls.angular_separation(float(point['ra']), float(point['dec']), ra, dec)
+
+    @classmethod
+    def create_pixel_map(cls, region, pixel_side):
+        """Compute the map pixel grid shifting from side to center.
+
+        Paramter
+        --------
+        pixel_side : array
+            edges of pixels
+
+        Return
+        ------
+        pixels_midpoint : list
+            centers of pixels
+        """
+        ra, dec = cls.pixel_grid(region, pixel_side)
+        return [{'ra': r, 'dec': d} for r, d in zip(ra, dec)]
+
+    @classmethod
+    def select_points_in_region(cls, midpoints, region):
+        """Select pixels within region.
+
+        Parameter
+        ---------
+        midpoints : array
+            center point of pixels
+        region : dict
+            region dictionary with ra, dec, rad in degrees
+
+        Return
+        ------
+        midpoints : array
+            selected array of midpoints within region
+        """
+        ra = np.array([p['ra'] for p in midpoints], dtype=np.float64)
+        dec = np.array([p['dec'] for p in midpoints], dtype=np.float64)
+        return np.extract(cls.points_in_region(ra, dec, region), midpoints)
+
+    @classmethod
+    def get_thetas(cls, point, midpoints):
         """Get thetas of points in region.
 
         Parameter
@@ -491,20 +721,9 @@ class EffectiveArea:
         thetas : list
             separation of midpoints from region center
         """
-        for k in ['ra', 'dec']:
-            if k in point:
-                continue
-            raise Exception('point coord {} is missing.'.format(k))
-        if len(midpoints) < 1:
-            raise Exception('need at least 1 point to check')
-        pnt = utils.get_skycoord(point)
-        midpoints_ra = []
-        midpoints_dec = []
-        for p in midpoints:
-            midpoints_ra.append(p['ra'])
-            midpoints_dec.append(p['dec'])
-        midpoints_coords = SkyCoord(midpoints_ra, midpoints_dec, unit='deg', frame='icrs')
-        return [ ang.degree for ang in pnt.separation(midpoints_coords) ]
+        ra = np.array([p['ra'] for p in midpoints], dtype=np.float64)
+        dec = np.array([p['dec'] for p in midpoints], dtype=np.float64)
+        return list(cls.get_offsets(point, ra, dec))
     
 class PSF:
     """Class that specifically operates on the Effective Area extension of an Instrument Response Function in FITS format.
@@ -524,10 +743,12 @@ class PSF:
         self.energies = None
         self.thetas = None
         self.psf_matrix = None
+        self.containment_radii = None
+        self.containment_matrix = None
         # check file
         if irf_filename is not None:
             self.irf_filename = irf_filename
-            irf = IRF(self.irf_filename)
+            irf = get_irf(self.irf_filename).irf
             self.psf_data = irf.get_psf_data()
         # check table
         elif psf_bintable is not None:
@@ -630,32 +851,8 @@ class PSF:
         if delta_max <= region_radius.degree:
             return (1.0, 0.0)
 
-        sigma_1, sigma_2, sigma_3, scale, ampl_2, ampl_3 = self.get_psf_values(theta, energy)
-        sigmas2_rad = [ np.deg2rad(s)**2 for s in [sigma_1, sigma_2, sigma_3] ]
-        prefactor_rad = 1.0 / (2.0 * np.pi * sigmas2_rad[0] + ampl_2 * sigmas2_rad[1] + ampl_3 * sigmas2_rad[2])
-
-        def psf_value(delta_rad):
-            """Compute the point spread function value.
-
-            Parameter
-            ---------
-            delta_rad : float
-                delta radius for integration
-
-            Return
-            ------
-            val : float
-                value of the psf
-            """
-            d2 = delta_rad**2
-            numerator  = np.exp( -1/2 * d2 / sigmas2_rad[0] )
-            numerator += np.exp( -1/2 * d2 / sigmas2_rad[1] ) * ampl_2 if sigma_2 > 0 else 0
-            numerator += np.exp( -1/2 * d2 / sigmas2_rad[2] ) * ampl_3 if sigma_3 > 0 else 0
-            return prefactor_rad * numerator
-
-        # integration to 0 to rad on region circumference of psf value
-        crf_psf_fn = lambda delta: psf_value(delta) * 2.0 * np.pi * np.sin(delta)
-        return integrate.quad(crf_psf_fn, 0, np.deg2rad(region_radius.degree))
+        # closed form integration from 0 to rad of the psf value
+        return (float(self.containment(theta.degree, energy, region_radius.degree)), 0.0)
 
     def get_psf_engine(self, region, pointing, energy):
         """Get the psf engine. The engine function can elaborate the psf rate given starting and stop angle [rad]. Each engine depends by theta (between source region and pointing, and energy.
@@ -682,10 +879,6 @@ class PSF:
         pnt_center    = utils.get_skycoord(pointing)
         theta = pnt_center.separation(region_center)
 
-        sigma_1, sigma_2, sigma_3, scale, ampl_2, ampl_3 = self.get_psf_values(theta, energy)
-        sigmas2_rad = [ np.deg2rad(s)**2 for s in [sigma_1, sigma_2, sigma_3] ]
-        prefactor_rad = 1.0 / (2.0 * np.pi * sigmas2_rad[0] + ampl_2 * sigmas2_rad[1] + ampl_3 * sigmas2_rad[2])
-
         def _integrate_psf(start_rad, stop_rad):
             """Integrate the point spread function.
             
@@ -703,31 +896,95 @@ class PSF:
             """
             if start_rad < 0:
                 raise Exception('The starting angle [rad] must be positive')
-
-            def psf_value(delta_rad):
-                """Compute the point spread function value.
-
-                Parameter
-                ---------
-                delta_rad : float
-                    delta radius for integration
-
-                Return
-                ------
-                val : float
-                    value of the psf
-                """
-                d2 = delta_rad**2
-                numerator  = np.exp( -1/2 * d2 / sigmas2_rad[0] )
-                numerator += np.exp( -1/2 * d2 / sigmas2_rad[1] ) * ampl_2 if sigma_2 > 0 else 0
-                numerator += np.exp( -1/2 * d2 / sigmas2_rad[2] ) * ampl_3 if sigma_3 > 0 else 0
-                return prefactor_rad * numerator
-
-            # integration to start_rad to stop_rad on region circumference of psf value
-            crf_psf_fn = lambda delta: psf_value(delta) * 2.0 * np.pi * np.sin(delta)
-            return integrate.quad(crf_psf_fn, start_rad, stop_rad)
+            # closed form integration from start_rad to stop_rad of the psf value
+            containment = self.containment(theta.degree, energy, np.rad2deg([start_rad, stop_rad]))
+            return (float(containment[1] - containment[0]), 0.0)
         return _integrate_psf
 
+    def containment(self, offsets, energies, radius):
+        """Compute the integral of the triple gaussian psf within radius, in the small angle approximation, with the normalisation of the psf value used by get_psf_engine. Offsets, energies and radius are broadcast together; the psf parameters are the plain values of the (theta, energy) bins, as in get_psf_values. If the containment table was built, the values are interpolated from it.
+
+                        Σ aᵢ σᵢ² (1 - exp(-R² / 2σᵢ²))
+        containment = ---------------------------------    with a₁ = 1
+                        σ₁² + (a₂ σ₂² + a₃ σ₃²) / 2π
+
+        Parameter
+        ---------
+        offsets : float or array
+            offsets from pointing in degrees
+        energies : float or array
+            energy values in [TeV]
+        radius : float or array
+            containment radius in degrees
+
+        Return
+        ------
+        containment : ndarray
+            contained fraction of the psf
+        """
+        psf_matrix, energy_bins, theta_bins = self.get_data_matrices()
+        offsets, energies, radius = np.broadcast_arrays(np.asarray(offsets, dtype=np.float64), np.asarray(energies, dtype=np.float64), np.asarray(radius, dtype=np.float64))
+        theta_index = bin_indexes(theta_bins, offsets, 'Theta offset is out of range ({})')
+        energy_index = bin_indexes(energy_bins, energies, 'Energy is out of range ({})')
+        if self.containment_matrix is not None:
+            table = self.containment_matrix[theta_index, energy_index]
+            radius = np.clip(radius, self.containment_radii[0], self.containment_radii[-1])
+            upper = np.clip(np.searchsorted(self.containment_radii, radius, side='right'), 1, len(self.containment_radii) - 1)
+            r_lo, r_hi = self.containment_radii[upper - 1], self.containment_radii[upper]
+            c_lo = np.take_along_axis(table, (upper - 1)[..., np.newaxis], axis=-1)[..., 0]
+            c_hi = np.take_along_axis(table, upper[..., np.newaxis], axis=-1)[..., 0]
+            return c_lo + (c_hi - c_lo) * (radius - r_lo) / (r_hi - r_lo)
+        return self.gaussians_containment(psf_matrix[theta_index, energy_index], radius)
+
+    @staticmethod
+    def gaussians_containment(parameters, radius):
+        """Compute the closed form containment of the triple gaussian psf.
+
+        Parameter
+        ---------
+        parameters : ndarray
+            psf matrix entries with SIGMA_1, SIGMA_2, SIGMA_3, AMPL_2, AMPL_3 fields
+        radius : float or array
+            containment radius in degrees, broadcast against parameters
+
+        Return
+        ------
+        containment : ndarray
+            contained fraction of the psf
+        """
+        radius2 = np.asarray(radius, dtype=np.float64)**2
+        norm = np.zeros(np.broadcast(parameters, radius2).shape)
+        contained = np.zeros(norm.shape)
+        for sigma, ampl in (('SIGMA_1', None), ('SIGMA_2', 'AMPL_2'), ('SIGMA_3', 'AMPL_3')):
+            sigma2 = parameters[sigma].astype(np.float64)**2
+            weight = sigma2 if ampl is None else parameters[ampl] * sigma2
+            # components with null sigma do not contribute
+            weight = np.where(sigma2 > 0, weight, 0)
+            contained += weight * -np.expm1(-radius2 / (2 * np.where(sigma2 > 0, sigma2, 1)))
+            # prefactor 1 / (2π σ₁² + a₂ σ₂² + a₃ σ₃²) of the psf value
+            norm += weight if ampl is None else weight / (2 * np.pi)
+        return contained / norm
+
+    def build_containment_table(self, radii=None):
+        """Precompute the containment of every (theta, energy) bin on a grid of radii, afterwards containment() interpolates the table in radius.
+
+        Parameter
+        ---------
+        radii : array or None
+            grid of radii in degrees, default 0 to 1 degrees in 0.005 degrees steps
+
+        Return
+        ------
+        containment_matrix : ndarray
+            containment table with shape (theta, energy, radii)
+        """
+        psf_matrix, energy_bins, theta_bins = self.get_data_matrices()
+        if radii is None:
+            radii = np.linspace(0, 1, 201)
+        self.containment_radii = np.asarray(radii, dtype=np.float64)
+        self.containment_matrix = self.gaussians_containment(psf_matrix[..., np.newaxis], self.containment_radii)
+        return self.containment_matrix
+
     def get_psf_delta_max(self, offset, energy):
         """Compute maximum delta value [deg] for theta and energy, which is 5*sigma value. 
 
@@ -751,6 +1008,27 @@ class PSF:
             sigma = sigma_3
         return 5.0 * sigma
 
+    def psf_values(self, offsets, energies):
+        """Get the psf data (sigma_1, sigma_2, sigma_3, scale, ampl_2, ampl_3) of the (theta, energy) bin of each offset and energy. This method returns plain values. No interpolation.
+
+        Parameter
+        ---------
+        offsets : float or array
+            offsets from pointing in degrees
+        energies : float or array
+            energy values in [TeV]
+
+        Return
+        ------
+        psf : ndarray
+            point spread function structured data with the broadcast shape of offsets and energies
+        """
+        psf_matrix, energy_bins, theta_bins = self.get_data_matrices()
+        offsets, energies = np.broadcast_arrays(np.asarray(offsets, dtype=np.float64), np.asarray(energies, dtype=np.float64))
+        theta_index = bin_indexes(theta_bins, offsets, 'Theta offset is out of range ({})')
+        energy_index = bin_indexes(energy_bins, energies, 'Energy is out of range ({})')
+        return psf_matrix[theta_index, energy_index]
+
     def get_psf_values(self, offset, energy):
         """Get the psf data array (sigma_1, sigma_2, sigma_3, scale, ampl_2, ampl_3). This method returns plain value. No interpolation.
 
@@ -767,23 +1045,29 @@ class PSF:
             point spread function ndarray data
         """
         offset_angle = utils.get_angle(offset)
-        psf_matrix, energy_bins, theta_bins = self.get_data_matrices()
+        return self.psf_values(offset_angle.degree, energy)[()]
 
-        theta_index = None
-        energy_index = None
-        for i, tb in enumerate(theta_bins):
-            if offset_angle.degree >= tb[0] and offset_angle.degree < tb[1]:
-                theta_index = i
-                break
-        for j, en in enumerate(energy_bins):
-            if energy >= en[0] and energy < en[1]:
-                energy_index = j
-                break
-        if theta_index is None:
-            raise Exception('Theta offset is out of range ({})'.format(offset))
-        if energy_index is None:
-            raise Exception('Energy is out of range ({})'.format(energy))
-        return psf_matrix[theta_index, energy_index]
+    def psf_1d_log(self, offsets, energies):
+        """Compute psf data (sigma_1, sigma_2, sigma_3, scale, ampl_2, ampl_3) via 1d interpolation on log energy within the theta bin of each offset, for broadcast arrays of offsets and energies.
+
+        Parameter
+        ---------
+        offsets : float or array
+            offsets from pointing in degrees
+        energies : float or array
+            energy values in [TeV]
+
+        Return
+        ------
+        psf : tuple
+            interpolated arrays for each psf field
+        """
+        psf_matrix, energy_bins, theta_bins = self.get_data_matrices()
+        theta_index = bin_indexes(theta_bins, offsets, 'Theta offset is out of range ({})')
+        energy_mid = np.mean(np.log10(energy_bins, dtype=np.float64), axis=1)
+        values = np.stack([psf_matrix[f] for f in self.fields], axis=-1)
+        interpolated = interpolate_rows(energy_mid, values, theta_index, np.log10(energies))
+        return tuple(np.moveaxis(interpolated, -1, 0))
 
     # this interpolated is a test
     def get_psf_1d_log(self, offset, energy):
@@ -801,23 +1085,181 @@ class PSF:
             values of interpolated psf
         """
         offset_angle = utils.get_angle(offset)
-        psf_matrix, energy_bins, theta_bins = self.get_data_matrices()
+        return self.psf_1d_log(offset_angle.degree, energy)
 
-        theta_index = None
-        for i, tb in enumerate(theta_bins):
-            if offset_angle.degree >= tb[0] and offset_angle.degree < tb[1]:
-                theta_index = i
-                break
-        if theta_index is None:
-            raise Exception('Theta offset is out of range ({})'.format(offset))
-
-        # energy interpolation
-        energy_mid = [ (e[0]+e[1])/2 for e in np.log10(energy_bins) ]
-        y_values = []
-        for f in self.fields:
-            y_values.append(psf_matrix[theta_index][f])
-        interp_fn = interpolate.interp1d(x = energy_mid, y = y_values)
-        return tuple(interp_fn(np.log10(energy)))
+class Background:
+    """Class that operates on the Background extension of an Instrument Response Function in FITS format. The background rate cube is indexed as [energy, dety, detx] and is interpolated linearly in log energy and detector coordinates, it is zero outside the cube.
+
+    Parameter
+    ---------
+    irf_filename : str
+        path to the IRF file in FITS format
+    bkg_bintable : FITS extension
+        background FITS extension
+    """
+    def __init__(self, irf_filename=None, bkg_bintable=None):
+        self.irf_filename = None
+        self.bkg_data = None
+        if irf_filename is not None:
+            self.irf_filename = irf_filename
+            self.bkg_data = get_irf(self.irf_filename).irf.get_extension('BACKGROUND')
+        elif bkg_bintable is not None:
+            self.bkg_data = bkg_bintable
+        if self.bkg_data is None:
+            raise Exception('Need an irf or background bintable')
+        data = self.bkg_data.data
+        self.energies = np.column_stack((data.field('ENERG_LO')[0], data.field('ENERG_HI')[0]))
+        self.detx = np.column_stack((data.field('DETX_LO')[0], data.field('DETX_HI')[0]))
+        self.dety = np.column_stack((data.field('DETY_LO')[0], data.field('DETY_HI')[0]))
+        self.bkg_matrix = np.asarray(data.field('BKG')[0], dtype=np.float64)
+        if self.bkg_matrix.shape != (len(self.energies), len(self.dety), len(self.detx)):
+            raise Exception('Unexpected BKG cube shape {}'.format(self.bkg_matrix.shape))
+        self.log_energy_mid = np.log10(self.energies.mean(axis=1))
+        self.bkg_interpolator = interpolate.RegularGridInterpolator((self.log_energy_mid, self.dety.mean(axis=1), self.detx.mean(axis=1)), self.bkg_matrix, method='linear', bounds_error=False, fill_value=0.0)
+
+    @staticmethod
+    def detector_coordinates(pointing, ra, dec):
+        """Detector coordinates of sky positions, as ctools: DETX = θ cos(φ) and DETY = θ sin(φ), with θ the offset from the pointing and φ the position angle east of north.
+
+        Parameter
+        ---------
+        pointing : dict
+            pointing coordinates with ra, dec in degrees
+        ra : array
+            right ascension in degrees
+        dec : array
+            declination in degrees
+
+        Return
+        ------
+        detx : ndarray
+            detector x coordinate in degrees
+        dety : ndarray
+            detector y coordinate in degrees
+        """
+        ra1, dec1 = np.deg2rad(float(pointing['ra'])), np.deg2rad(float(pointing['dec']))
+        ra2, dec2 = np.deg2rad(np.asarray(ra, dtype=np.float64)), np.deg2rad(np.asarray(dec, dtype=np.float64))
+        dra = ra2 - ra1
+        x = np.cos(dec1) * np.sin(dec2) - np.sin(dec1) * np.cos(dec2) * np.cos(dra)
+        y = np.cos(dec2) * np.sin(dra)
+        z = np.sin(dec1) * np.sin(dec2) + np.cos(dec1) * np.cos(dec2) * np.cos(dra)
+        theta = np.rad2deg(np.arctan2(np.hypot(x, y), z))
+        phi = np.arctan2(y, x)
+        return theta * np.cos(phi), theta * np.sin(phi)
+
+    def rate(self, detx, dety, energies):
+        """Background rate in [MeV-1 s-1 sr-1] for broadcast arrays of detector coordinates and energies. Points within the cube but beyond the outermost bin centers take the value of the closest center.
+
+        Parameter
+        ---------
+        detx : float or array
+            detector x coordinate in degrees
+        dety : float or array
+            detector y coordinate in degrees
+        energies : float or array
+            energies in [TeV]
+
+        Return
+        ------
+        rate : ndarray
+            background rate
+        """
+        detx, dety, energies = np.broadcast_arrays(np.asarray(detx, dtype=np.float64), np.asarray(dety, dtype=np.float64), np.asarray(energies, dtype=np.float64))
+        inside = (detx >= self.detx[0, 0]) & (detx <= self.detx[-1, 1]) & (dety >= self.dety[0, 0]) & (dety <= self.dety[-1, 1]) & (energies >= self.energies[0, 0]) & (energies <= self.energies[-1, 1])
+        grid = self.bkg_interpolator.grid
+        points = np.stack((np.clip(np.log10(np.where(inside, energies, self.energies[0, 0])), grid[0][0], grid[0][-1]), np.clip(dety, grid[1][0], grid[1][-1]), np.clip(detx, grid[2][0], grid[2][-1])), axis=-1)
+        rate = self.bkg_interpolator(points.reshape(-1, 3)).reshape(detx.shape)
+        return np.where(inside, rate, 0.0)
+
+    def integrated_rate(self, detx, dety, erange, steps_per_decade=50):
+        """Background rate in [s-1 sr-1] integrated over an energy range with the trapezoidal rule on a log energy grid.
+
+        Parameter
+        ---------
+        detx : array
+            detector x coordinate in degrees
+        dety : array
+            detector y coordinate in degrees
+        erange : list
+            energy interval with [emin, emax] in TeV
+        steps_per_decade : int
+            number of integration steps for each decade of energy
+
+        Return
+        ------
+        rate : ndarray
+            integrated background rate for each point
+        """
+        if erange[0] <= 0 or erange[1] <= erange[0]:
+            raise Exception('need 0 < emin < emax')
+        steps = max(int(np.ceil(np.log10(erange[1] / erange[0]) * steps_per_decade)), 1)
+        energies = np.logspace(np.log10(erange[0]), np.log10(erange[1]), steps + 1)
+        rates = self.rate(np.asarray(detx)[..., np.newaxis], np.asarray(dety)[..., np.newaxis], energies)
+        # the cube is per MeV while energies are in TeV
+        return integrate.trapezoid(rates, energies * 1e6, axis=-1)
+
+    def region_rates(self, regions, pointing, erange, pixel_size=0.05, steps_per_decade=50):
+        """Expected background rate in [s-1] within each region, from the mean integrated rate of the region pixels times the region solid angle. All the pixels of all regions are evaluated at once.
+
+        Parameter
+        ---------
+        regions : list
+            list of regions dictionary with ra, dec, rad in degrees
+        pointing : dict
+            pointing coordinates with ra, dec in degrees
+        erange : list
+            energy interval with [emin, emax] in TeV
+        pixel_size : float
+            size of a pixel in degrees
+        steps_per_decade : int
+            number of integration steps for each decade of energy
+
+        Return
+        ------
+        rates : ndarray
+            background counts rate of each region
+        """
+        ra, dec, labels = [], [], []
+        for i, region in enumerate(regions):
+            region_ra, region_dec = EffectiveArea.pixel_grid(region, pixel_size)
+            inside = EffectiveArea.points_in_region(region_ra, region_dec, region)
+            if not inside.any():
+                raise Exception('need at least 1 point to check')
+            ra.append(region_ra[inside])
+            dec.append(region_dec[inside])
+            labels.append(np.full(np.count_nonzero(inside), i))
+        labels = np.concatenate(labels)
+        detx, dety = self.detector_coordinates(pointing, np.concatenate(ra), np.concatenate(dec))
+        rates = self.integrated_rate(detx, dety, erange, steps_per_decade)
+        mean_rates = np.bincount(labels, weights=rates, minlength=len(regions)) / np.bincount(labels, minlength=len(regions))
+        solid_angles = 2 * np.pi * (1 - np.cos(np.deg2rad([float(r['rad']) for r in regions])))
+        return mean_rates * solid_angles
+
+def background_counts(irf_file, regions, pointing, erange, livetimes, pixel_size=0.05):
+    '''Expected background counts from the IRF background cube, without simulation.
+
+    Parameter
+    ---------
+    irf_file : str
+        path to IRF in FITS format
+    regions : list
+        list of regions dictionary with ra, dec, rad in degrees
+    pointing : dict
+        pointing coordinates with ra, dec in degrees
+    erange : list
+        energy interval with [emin, emax] in TeV
+    livetimes : float or array
+        exposures in [s]
+    pixel_size : float
+        size of a pixel in degrees
+
+    Return
+    ------
+    counts : ndarray
+        expected counts with shape (regions, livetimes)
+    '''
+    rates = get_irf(irf_file).background().region_rates(regions, pointing, erange, pixel_size)
+    return np.multiply.outer(rates, np.atleast_1d(np.asarray(livetimes, dtype=np.float64)))
 
 def aeff_eval(args, src, pnt):
     '''Compute the region response of IRF.
@@ -837,8 +1279,310 @@ def aeff_eval(args, src, pnt):
     if not(args.emin and args.emax and args.pixel_size and args.power_law_index):
         raise Exception('need energy min and max, a pixel size to eval the flux')
 
-    aeff = EffectiveArea(irf_filename=args.irf_file)
+    on_reg_aeff = region_response(args.irf_file, src, pnt, [args.emin, args.emax], args.pixel_size, args.power_law_index)
+    return on_reg_aeff
+
+def region_response(irf_file, src, pnt, erange, pixel_size=0.05, index=-2.4, cache=None):
+    '''Compute the region response of IRF. The pixel grid of the region steps in ra and dec, so the response depends on the declinations of region and pointing and on their ra difference, besides the IRF content, the region radius, the energy range, the spectral index and the pixel size. It is memoized on these by the region response cache.
+
+    Parameter
+    ---------
+    irf_file : str
+        path to IRF in FITS format
+    src : dict
+        on region coordinates with ra, dec, rad in degrees
+    pnt : dict
+        pointing coordinates with ra, dec in degrees
+    erange : list
+        energy interval with [emin, emax] in TeV
+    pixel_size : float
+        size of a pixel in degrees
+    index : float
+        powerlaw spectral index
+    cache : RegionResponseCache or None
+        cache to use, None for the process-wide one
+
+    Return
+    ------
+    on_reg_aeff : float
+        effective area response in [cm2] for on region
+    '''
+    if cache is None:
+        cache = get_response_cache()
+    pointing = utils.get_skycoord(pnt)
+    delta_ra = (pointing.ra.deg - float(src['ra']) + 180) % 360 - 180
+    key = cache.make_key(irf_file, dec=src['dec'], pnt_dec=pointing.dec.deg, delta_ra=delta_ra, rad=src['rad'], emin=erange[0], emax=erange[1], pixel_size=pixel_size, index=index)
     # these IRFs return value in m², so we need convert
     # the source data struct need a 'rad'
-    on_reg_aeff = aeff.weighted_value_for_region(src, pnt, [args.emin, args.emax], args.pixel_size, args.power_law_index) * 1e4 # cm2
-    return on_reg_aeff
+    compute = lambda: get_irf(irf_file).effective_area().weighted_value_for_region(src, pnt, list(erange), pixel_size, index) * 1e4 # cm2
+    return cache.get_or_compute(key, compute)
+
+class IrfTables:
+    """Parsed content of an IRF file, shared by the whole process through get_irf. The first row of every column of the EFFECTIVE AREA, POINT SPREAD FUNCTION, ENERGY DISPERSION and BACKGROUND extensions is exposed as a read-only ndarray, the EffectiveArea, PSF and Background objects (with their interpolators) are built on first use.
+
+    Parameter
+    ---------
+    filename : str
+        path to IRF in FITS format
+    """
+    extensions = ('EFFECTIVE AREA', 'POINT SPREAD FUNCTION', 'ENERGY DISPERSION', 'BACKGROUND')
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.irf = IRF(filename)
+        self.tables = {}
+        for extension in self.extensions:
+            if extension not in self.irf.hdul:
+                continue
+            data = self.irf.get_extension(extension).data
+            columns = {}
+            for name in data.columns.names:
+                column = np.array(data.field(name)[0])
+                column.flags.writeable = False
+                columns[name] = column
+            self.tables[extension] = columns
+        self.aeff_engine = None
+        self.psf_engine = None
+        self.bkg_engine = None
+        self.gammapy_irfs = None
+
+    def table(self, extension):
+        """Columns of an IRF extension.
+
+        Parameter
+        ---------
+        extension : str
+            extension name
+
+        Return
+        ------
+        columns : dict
+            read-only ndarray for each column, in the FITS columns order
+        """
+        if extension not in self.tables:
+            raise Exception('Missing {} extension in {}'.format(extension, self.filename))
+        return self.tables[extension]
+
+    @property
+    def aeff(self):
+        return self.table('EFFECTIVE AREA')
+
+    @property
+    def psf_table(self):
+        return self.table('POINT SPREAD FUNCTION')
+
+    @property
+    def edisp(self):
+        return self.table('ENERGY DISPERSION')
+
+    @property
+    def bkg(self):
+        return self.table('BACKGROUND')
+
+    def effective_area(self):
+        """Shared EffectiveArea of the IRF."""
+        if self.aeff_engine is None:
+            self.aeff_engine = EffectiveArea(irf_filename=self.filename)
+        return self.aeff_engine
+
+    def psf(self):
+        """Shared PSF of the IRF."""
+        if self.psf_engine is None:
+            self.psf_engine = PSF(irf_filename=self.filename)
+        return self.psf_engine
+
+    def background(self):
+        """Shared Background of the IRF."""
+        if self.bkg_engine is None:
+            self.bkg_engine = Background(irf_filename=self.filename)
+        return self.bkg_engine
+
+    def gammapy(self):
+        """IRFs loaded with gammapy load_cta_irfs, imported only when needed."""
+        if self.gammapy_irfs is None:
+            from gammapy.irf import load_cta_irfs
+            self.gammapy_irfs = load_cta_irfs(self.filename)
+        return self.gammapy_irfs
+
+# parsed IRF files, keyed by (path, modification time, size)
+_irf_registry = {}
+
+def get_irf(filename):
+    """Get the parsed IRF file, which is read only once per process (and again only if the file changes).
+
+    Parameter
+    ---------
+    filename : str
+        path to IRF in FITS format
+
+    Return
+    ------
+    irf : IrfTables
+        parsed IRF
+    """
+    path = os.path.realpath(os.path.expandvars(filename))
+    stat = os.stat(path)
+    version = (path, stat.st_mtime_ns, stat.st_size)
+    if version not in _irf_registry:
+        _irf_registry[version] = IrfTables(path)
+    return _irf_registry[version]
+
+def preload_irfs(filenames, engines=True):
+    """Parse IRF files ahead of use, e.g. in pool initialisers.
+
+    Parameter
+    ---------
+    filenames : list
+        paths to IRFs in FITS format
+    engines : bool
+        build also the EffectiveArea and PSF objects and their interpolators
+
+    Return
+    ------
+    irfs : list
+        parsed IRFs
+    """
+    irfs = [get_irf(f) for f in filenames]
+    if engines:
+        for irf in irfs:
+            if 'EFFECTIVE AREA' in irf.tables:
+                irf.effective_area()
+            if 'POINT SPREAD FUNCTION' in irf.tables:
+                irf.psf()
+    return irfs
+
+class ExposureMap:
+    """Spectrum-weighted exposure image of the field of view. Each pixel holds the effective area at the pixel offset from the pointing, weighted over the energy range with a powerlaw as in weighted_value_for_region, times the livetime.
+
+    Parameter
+    ---------
+    wcs : astropy WCS
+        celestial WCS of the image, with array_shape set
+    aeff_image : ndarray
+        spectrum-weighted effective area image in [cm2]
+    livetime : float
+        livetime in [s]
+    """
+    def __init__(self, wcs, aeff_image, livetime=1.0):
+        self.wcs = wcs
+        self.aeff_image = aeff_image
+        self.livetime = livetime
+        self.image = aeff_image * livetime
+
+    def pixel_index(self, coords):
+        """Pixel (y, x) containing each coordinate, None outside the image.
+
+        Parameter
+        ---------
+        coords : dict or tuple or list
+            coordinates with (ra, dec) in degrees
+
+        Return
+        ------
+        index : tuple or None
+            (y, x) pixel index
+        """
+        coords = utils.get_skycoord(coords)
+        x, y = self.wcs.wcs_world2pix(coords.ra.deg, coords.dec.deg, 0)
+        # coordinates outside the projection have no pixel
+        if not (np.isfinite(x) and np.isfinite(y)):
+            return None
+        x, y = int(np.rint(x)), int(np.rint(y))
+        if not (0 <= y < self.image.shape[0] and 0 <= x < self.image.shape[1]):
+            return None
+        return y, x
+
+    def value_at(self, coords):
+        """Exposure in [cm2 s] at the pixel containing coords, NaN outside the image."""
+        index = self.pixel_index(coords)
+        return np.nan if index is None else self.image[index]
+
+    def region_exposure(self, region):
+        """Mean exposure in [cm2 s] of the pixels whose center is within the region, NaN if none.
+
+        Parameter
+        ---------
+        region : dict
+            region dictionary with ra, dec, rad in degrees
+
+        Return
+        ------
+        exposure : float
+            region exposure in [cm2 s]
+        """
+        y, x = np.mgrid[0:self.image.shape[0], 0:self.image.shape[1]]
+        ra, dec = self.wcs.wcs_pix2world(x, y, 0)
+        inside = EffectiveArea.angular_separation(float(region['ra']), float(region['dec']), ra, dec) < float(region['rad'])
+        return self.image[inside].mean() if inside.any() else np.nan
+
+    def flux(self, excess):
+        """Flux in [ph/cm2/s] from excess counts on the same grid.
+
+        Parameter
+        ---------
+        excess : float or ndarray
+            excess counts, e.g. the excess image of a SignificanceMap with the same WCS
+
+        Return
+        ------
+        flux : ndarray
+            excess over exposure
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.image > 0, excess / self.image, np.nan)
+
+# spectrum-weighted effective area images, keyed by IRF content, pointing, geometry, energy range and index
+_exposure_maps = OrderedDict()
+
+# number of effective area images kept by exposure_map
+EXPOSURE_MAPS_CACHE_SIZE = 64
+
+def exposure_map(irf_file, pointing, wcs, erange, index=-2.4, livetime=1.0, psf_radius=None):
+    """Compute the spectrum-weighted exposure image of a WCS grid in a single vectorized pass. The effective area image does not depend on the livetime and is cached per IRF, pointing, geometry, energy range, index and psf radius.
+
+    Parameter
+    ---------
+    irf_file : str
+        path to IRF in FITS format
+    pointing : dict or tuple or list
+        pointing coordinates with (ra, dec) in degrees
+    wcs : astropy WCS
+        celestial WCS of the image, with array_shape set
+    erange : list
+        energy interval with [emin, emax] in TeV
+    index : float
+        powerlaw spectral index
+    livetime : float
+        livetime in [s]
+    psf_radius : float or None
+        if given, weight the effective area with the psf containment within this radius in degrees, as weighted_value_for_region does for point sources
+
+    Return
+    ------
+    exposure : ExposureMap
+        exposure image in [cm2 s]
+    """
+    pointing = utils.get_skycoord(pointing)
+    key = (irf_content_hash(irf_file), round(pointing.ra.deg, 9), round(pointing.dec.deg, 9), wcs.to_header_string(), tuple(wcs.array_shape), float(erange[0]), float(erange[1]), float(index), psf_radius)
+    if key in _exposure_maps:
+        _exposure_maps.move_to_end(key)
+    else:
+        aeff = get_irf(irf_file).effective_area()
+        y, x = np.mgrid[0:wcs.array_shape[0], 0:wcs.array_shape[1]]
+        ra, dec = wcs.wcs_pix2world(x, y, 0)
+        offsets = EffectiveArea.angular_separation(pointing.ra.deg, pointing.dec.deg, ra, dec)
+        energies_middle, weights = aeff.powerlaw_energy_weights(list(erange), index)
+        response = aeff.aeff(offsets[..., np.newaxis], energies_middle)
+        if psf_radius is not None:
+            psf = get_irf(irf_file).psf()
+            # beyond the psf theta range hold the edge value, as aeff does
+            theta_bins = psf.get_data_matrices()[2]
+            psf_offsets = np.clip(offsets, theta_bins[0, 0], np.nextafter(theta_bins[-1, 1], theta_bins[-1, 0]))
+            response *= psf.containment(psf_offsets[..., np.newaxis], energies_middle, psf_radius)
+        # these IRFs return value in m², so we need convert
+        image = np.tensordot(response, weights, axes=([-1], [0])) * 1e4 # cm2
+        image.flags.writeable = False
+        _exposure_maps[key] = image
+        while len(_exposure_maps) > EXPOSURE_MAPS_CACHE_SIZE:
+            _exposure_maps.popitem(last=False)
+    return ExposureMap(wcs, _exposure_maps[key], livetime)
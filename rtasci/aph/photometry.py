@@ -17,12 +17,12 @@
 # *****************************************************************************
 
 import numpy as np
+from functools import lru_cache
 from os import remove
 from os.path import isfile
 from astropy.coordinates import SkyCoord, Angle
 from astropy.io import fits
-from rtasci.aph import utils
-from rtasci.aph.irf import aeff_eval
+from scipy.spatial import cKDTree
 #from regions import CircleSkyRegion, Regions
 
 # Bintable columns:
@@ -35,6 +35,453 @@ from rtasci.aph.irf import aeff_eval
 # 6  name = 'DETY'; format = '1E'; unit = 'deg'
 #    name = 'MC_ID'; format = '1J'
 
+# columns required by the aperture photometry
+EVENTS_COLUMNS = ('RA', 'DEC', 'ENERGY', 'TIME')
+
+# events are counted in chunks to bound the size of the (events x regions) matrix
+COUNTING_CHUNK_SIZE = 2**18
+
+# off regions geometry as returned by off_regions_geometry
+REGION_DTYPE = np.dtype([('ra', np.float64), ('dec', np.float64), ('rad', np.float64)])
+
+# number of (algorithm, pointing, target, radius) geometries kept by off_regions_geometry
+OFF_REGIONS_CACHE_SIZE = 1024
+
+def unit_vectors(ra, dec):
+    """Convert equatorial coordinates into cartesian unit vectors.
+
+    Parameter
+    ---------
+    ra : float or array
+        right ascension in degrees
+    dec : float or array
+        declination in degrees
+
+    Return
+    ------
+    vectors : ndarray
+        unit vectors with shape (..., 3)
+    """
+    ra = np.deg2rad(np.asarray(ra, dtype=np.float64))
+    dec = np.deg2rad(np.asarray(dec, dtype=np.float64))
+    cos_dec = np.cos(dec)
+    return np.stack((cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)), axis=-1)
+
+def regions_to_arrays(regions):
+    """Extract centers and radii from a list of regions.
+
+    Parameter
+    ---------
+    regions : list or ndarray
+        list of regions dictionary or REGION_DTYPE array with ra, dec, rad in degrees
+
+    Return
+    ------
+    ra : ndarray
+        regions right ascension in degrees
+    dec : ndarray
+        regions declination in degrees
+    rad : ndarray
+        regions radius in degrees
+    """
+    if isinstance(regions, np.ndarray) and regions.dtype.names is not None:
+        return regions['ra'].astype(np.float64), regions['dec'].astype(np.float64), regions['rad'].astype(np.float64)
+    ra = np.array([float(r['ra']) for r in regions], dtype=np.float64)
+    dec = np.array([float(r['dec']) for r in regions], dtype=np.float64)
+    rad = np.array([utils.get_angle(float(r['rad'])).deg for r in regions], dtype=np.float64)
+    return ra, dec, rad
+
+def on_and_off_regions(src, rad, off_regions):
+    """Build the list of regions with the on region first followed by the off regions.
+
+    Parameter
+    ---------
+    src : dict or tuple or list or SkyCoord
+        on region center coordinates with (ra, dec) in degrees
+    rad : float or astropy Angle
+        on region radius in degrees
+    off_regions : list
+        list of regions dictionary with ra, dec, rad in degrees
+
+    Return
+    ------
+    regions : list
+        list of regions dictionary with ra, dec, rad in degrees
+    """
+    center = utils.get_skycoord(src)
+    on_region = {'ra': center.ra.deg, 'dec': center.dec.deg, 'rad': utils.get_angle(rad).deg}
+    return [on_region] + list(off_regions)
+
+def region_membership(vectors, regions):
+    """Flag which regions contain each unit vector.
+
+    Parameter
+    ---------
+    vectors : ndarray
+        events unit vectors with shape (N, 3)
+    regions : list
+        list of regions dictionary with ra, dec, rad in degrees
+
+    Return
+    ------
+    membership : ndarray
+        boolean matrix with shape (N, n_regions)
+    """
+    ra, dec, rad = regions_to_arrays(regions)
+    centers = unit_vectors(ra, dec)
+    # separation < radius <=> cos(separation) > cos(radius)
+    cos_rad = np.cos(np.deg2rad(rad))
+    membership = np.empty((len(vectors), len(centers)), dtype=bool)
+    for start in range(0, len(vectors), COUNTING_CHUNK_SIZE):
+        stop = start + COUNTING_CHUNK_SIZE
+        np.greater(vectors[start:stop] @ centers.T, cos_rad, out=membership[start:stop])
+    return membership
+
+def count_in_regions(vectors, regions):
+    """Count the unit vectors falling inside each region.
+
+    Parameter
+    ---------
+    vectors : ndarray
+        events unit vectors with shape (N, 3)
+    regions : list
+        list of regions dictionary with ra, dec, rad in degrees
+
+    Return
+    ------
+    counts : ndarray
+        integer counts for each region
+    """
+    return np.count_nonzero(region_membership(vectors, regions), axis=0)
+
+def coords_to_tuple(coords):
+    """Extract (ra, dec) in degrees as floats from any supported coordinates input.
+
+    Parameter
+    ---------
+    coords : dict or tuple or list or SkyCoord
+        coordinates with (ra, dec) in degrees
+
+    Return
+    ------
+    coords : tuple
+        (ra, dec) in degrees
+    """
+    if isinstance(coords, SkyCoord):
+        return float(coords.ra.deg), float(coords.dec.deg)
+    if isinstance(coords, dict) and 'ra' in coords and 'dec' in coords:
+        return float(coords['ra']), float(coords['dec'])
+    if isinstance(coords, (tuple, list)):
+        return float(coords[0]), float(coords[1])
+    raise Exception('The input parameter must be a SkyCoord, a { "ra": 12.3, "dec": 45.6 } dictionary, a (12.3, 45.6) tuple or a [12.3, 45.6] list.')
+
+def separation_and_position_angle(origin, target):
+    """Spherical separation and position angle (east of north) of target with respect to origin.
+
+    Parameter
+    ---------
+    origin : tuple
+        (ra, dec) in degrees
+    target : tuple
+        (ra, dec) in degrees
+
+    Return
+    ------
+    separation : float
+        angular separation in radians
+    position_angle : float
+        position angle in radians
+    """
+    ra1, dec1 = np.deg2rad(origin)
+    ra2, dec2 = np.deg2rad(target)
+    dra = ra2 - ra1
+    x = np.cos(dec1) * np.sin(dec2) - np.sin(dec1) * np.cos(dec2) * np.cos(dra)
+    y = np.cos(dec2) * np.sin(dra)
+    z = np.sin(dec1) * np.sin(dec2) + np.cos(dec1) * np.cos(dec2) * np.cos(dra)
+    return np.arctan2(np.hypot(x, y), z), np.arctan2(y, x)
+
+def offset_by(origin, position_angles, separation):
+    """Points at a given separation and position angles from origin on the sphere, vectorized over the position angles.
+
+    Parameter
+    ---------
+    origin : tuple
+        (ra, dec) in degrees
+    position_angles : array
+        position angles (east of north) in radians
+    separation : float
+        angular separation in radians
+
+    Return
+    ------
+    ra : ndarray
+        right ascension in degrees within [0, 360)
+    dec : ndarray
+        declination in degrees
+    """
+    ra, dec = np.deg2rad(origin)
+    position_angles = np.asarray(position_angles, dtype=np.float64)
+    sin_dec = np.sin(dec) * np.cos(separation) + np.cos(dec) * np.sin(separation) * np.cos(position_angles)
+    new_dec = np.arcsin(np.clip(sin_dec, -1, 1))
+    new_ra = ra + np.arctan2(np.sin(position_angles) * np.sin(separation) * np.cos(dec), np.cos(separation) - np.sin(dec) * sin_dec)
+    return np.rad2deg(new_ra) % 360, np.rad2deg(new_dec)
+
+@lru_cache(maxsize=OFF_REGIONS_CACHE_SIZE)
+def off_regions_geometry(algo, pointing, target, rad, skip_adjacent=True, min_regions_number=4):
+    """Off regions centers computed on the sphere by rotating the target around the pointing. The geometry depends only on its arguments, so it is cached and shared by all the trials with the same pointing, target and radius. The returned array is read-only.
+
+    Parameter
+    ---------
+    algo : str
+        algorithm for off regions determination ("reflection", "cross" or "wobble")
+    pointing : tuple
+        pointing (ra, dec) in degrees
+    target : tuple
+        target (ra, dec) in degrees
+    rad : float
+        region radius in degrees
+    skip_adjacent : bool
+        skip the two reflected regions adjacent to the on region
+    min_regions_number : int
+        minimum number of reflected regions centers on the circle
+
+    Return
+    ------
+    regions : ndarray
+        REGION_DTYPE array with ra, dec, rad in degrees
+    """
+    separation, starting_pos_angle = separation_and_position_angle(pointing, target)
+    if algo.lower() in ('cross', 'wobble'):
+        steps = np.arange(1, 4) * (np.pi / 2)
+    elif algo.lower() == 'reflection':
+        # Angular separation of reflected regions. 1.05 factor is to have a margin
+        numbers_of_reflected_regions = int(2 * np.pi * np.rad2deg(separation) / (1.05 * 2.0 * rad))
+        # Skip the source region and the two near => at least 4 centers to get one off region.
+        if numbers_of_reflected_regions < min_regions_number:
+            raise Exception('the combination of region radius and coordinates does not allow to compute reflected regions.')
+        if skip_adjacent:
+            indexes = np.arange(2, numbers_of_reflected_regions - 1)
+        else:
+            indexes = np.arange(1, numbers_of_reflected_regions)
+        steps = indexes * (2 * np.pi / numbers_of_reflected_regions)
+    else:
+        raise Exception('invalid background regions algorithm')
+    regions = np.empty(len(steps), dtype=REGION_DTYPE)
+    regions['ra'], regions['dec'] = offset_by(pointing, starting_pos_angle + steps, separation)
+    regions['rad'] = rad
+    regions.flags.writeable = False
+    return regions
+
+def cached_off_regions(algo, pointing, target, rad, skip_adjacent=True, min_regions_number=4):
+    """Off regions from the cached spherical geometry as a list of regions dictionary.
+
+    Parameter
+    ---------
+    algo : str
+        algorithm for off regions determination ("reflection", "cross" or "wobble")
+    pointing : dict or tuple or list or SkyCoord
+        pointing coordinates with (ra, dec) in degrees
+    target : dict or tuple or list or SkyCoord
+        target coordinates with (ra, dec) in degrees
+    rad : float or astropy Angle
+        region radius in degrees
+    skip_adjacent : bool
+        skip the two reflected regions adjacent to the on region
+    min_regions_number : int
+        minimum number of reflected regions centers on the circle
+
+    Return
+    ------
+    regions : list
+        list of regions dictionary with ra, dec, rad in degrees
+    """
+    rad = float(rad.deg) if isinstance(rad, Angle) else float(rad)
+    regions = off_regions_geometry(algo.lower(), coords_to_tuple(pointing), coords_to_tuple(target), rad, bool(skip_adjacent), int(min_regions_number))
+    return [{'ra': float(r['ra']), 'dec': float(r['dec']), 'rad': float(r['rad'])} for r in regions]
+
+class TimeIndexedEvents():
+    """Events container indexed in TIME. The events are kept sorted in TIME (ordering is detected and enforced only if needed) so that a [tmin, tmax] selection resolves into a slice via binary search and all the selections are views of the data.
+
+    Parameter
+    ---------
+    events_data : FITS_rec or np.recarray
+        events data with (at least) RA, DEC and ENERGY columns
+    """
+    def __init__(self, events_data):
+        self.events_data = events_data
+        self.times = None
+        self.vectors_cache = None
+        self.tree = None
+        # plain (not structured) arrays have no columns to index
+        if events_data.dtype.names is not None and 'TIME' in events_data.dtype.names:
+            times = np.asarray(events_data['TIME'])
+            if not self.is_time_sorted(times):
+                # stable sort to preserve the original order of simultaneous events
+                order = np.argsort(times, kind='stable')
+                self.events_data = events_data[order]
+                times = np.asarray(self.events_data['TIME'])
+            self.times = times
+
+    def __len__(self):
+        return len(self.events_data)
+
+    @staticmethod
+    def is_time_sorted(times):
+        """Check if times are sorted in ascending order.
+
+        Parameter
+        ---------
+        times : ndarray
+            events times
+
+        Return
+        ------
+        sorted : bool
+            True if times are in ascending order
+        """
+        return bool(np.all(times[1:] >= times[:-1]))
+
+    @property
+    def vectors(self):
+        """Events cartesian unit vectors, computed once on first access."""
+        if self.vectors_cache is None:
+            self.vectors_cache = unit_vectors(self.events_data['RA'], self.events_data['DEC'])
+        return self.vectors_cache
+
+    def time_slice(self, tmin=None, tmax=None):
+        """Resolve the [tmin, tmax] time selection (both edges included) into a slice.
+
+        Parameter
+        ---------
+        tmin : float or None
+            minimum time selection cut
+        tmax : float or None
+            maximum time selection cut
+
+        Return
+        ------
+        window : slice
+            slice of the events within the time selection
+        """
+        if tmin is None and tmax is None:
+            return slice(0, len(self.events_data))
+        if self.times is None:
+            raise Exception("Events data has no 'TIME' col")
+        start = 0 if tmin is None else int(np.searchsorted(self.times, tmin, side='left'))
+        stop = len(self.times) if tmax is None else int(np.searchsorted(self.times, tmax, side='right'))
+        return slice(start, max(start, stop))
+
+    def energy_mask(self, window, emin=None, emax=None):
+        """Boolean mask of the events within the energy selection cuts for a time window.
+
+        Parameter
+        ---------
+        window : slice
+            slice of the events within the time selection
+        emin : float or None
+            minimum energy selection cut
+        emax : float or None
+            maximum energy selection cut
+
+        Return
+        ------
+        mask : ndarray or None
+            boolean mask of the selected events in the window, None if no energy cut applies
+        """
+        if emin is None and emax is None:
+            return None
+        energies = self.events_data['ENERGY'][window]
+        mask = np.full(len(energies), True)
+        if emin is not None:
+            mask &= energies >= emin
+        if emax is not None:
+            mask &= energies <= emax
+        return mask
+
+    def selected_vectors(self, emin=None, emax=None, tmin=None, tmax=None):
+        """Unit vectors of the events within the energy and time selection cuts.
+
+        Parameter
+        ---------
+        emin : float or None
+            minimum energy selection cut
+        emax : float or None
+            maximum energy selection cut
+        tmin : float or None
+            minimum time selection cut
+        tmax : float or None
+            maximum time selection cut
+
+        Return
+        ------
+        vectors : ndarray
+            unit vectors of the selected events, a view if no energy cut applies
+        """
+        window = self.time_slice(tmin=tmin, tmax=tmax)
+        vectors = self.vectors[window]
+        mask = self.energy_mask(window, emin=emin, emax=emax)
+        if mask is not None:
+            vectors = vectors[mask]
+        return vectors
+
+    def build_spatial_index(self):
+        """Build a KD-tree over the events unit vectors. It is built once per events list and then serves every region query in O(log N + k).
+
+        Parameter
+        ---------
+
+        Return
+        ------
+
+        """
+        if self.tree is None:
+            self.tree = cKDTree(self.vectors)
+        return self
+
+    def indexed_count_regions(self, regions, emin=None, emax=None, tmin=None, tmax=None):
+        """Count photons in many regions querying the spatial index. Only the events found by the tree are checked against the selection cuts.
+
+        Parameter
+        ---------
+        regions : list
+            list of regions dictionary with ra, dec, rad in degrees
+        emin : float or None
+            minimum energy selection cut
+        emax : float or None
+            maximum energy selection cut
+        tmin : float or None
+            minimum time selection cut
+        tmax : float or None
+            maximum time selection cut
+
+        Return
+        ------
+        counts : ndarray
+            integer counts for each region, in the same order of the input
+        """
+        self.build_spatial_index()
+        window = self.time_slice(tmin=tmin, tmax=tmax)
+        ra, dec, rad = regions_to_arrays(regions)
+        centers = unit_vectors(ra, dec)
+        cos_rad = np.cos(np.deg2rad(rad))
+        # angular radius to chord length on the unit sphere (with a margin for rounding)
+        chords = 2 * np.sin(np.deg2rad(rad) / 2) * (1 + 1e-9)
+        counts = np.zeros(len(centers), dtype=np.int64)
+        for i, center in enumerate(centers):
+            idx = np.asarray(self.tree.query_ball_point(center, chords[i]), dtype=np.int64)
+            # same strict separation cut of count_in_regions
+            idx = idx[self.vectors[idx] @ center > cos_rad[i]]
+            idx = idx[(idx >= window.start) & (idx < window.stop)]
+            if emin is not None or emax is not None:
+                energies = self.events_data['ENERGY'][idx]
+                if emin is not None:
+                    idx = idx[energies >= emin]
+                    energies = energies[energies >= emin]
+                if emax is not None:
+                    idx = idx[energies <= emax]
+            counts[i] = len(idx)
+        return counts
+
 class Photometrics():
     """This class contains the core of the RTAPH tool. It allows the extraction of on and off regions as well as perform aperture photometry."""
     def __init__(self, args):
@@ -43,12 +490,16 @@ class Photometrics():
         self.mandatory_fields = ['RA', 'DEC', 'ENERGY']
         if 'events_filename' in args:
             self.events_filename = args['events_filename']
-            self.events_data = self.load_data_from_fits_file(self.events_filename)
+            self.events_data = self.load_data_from_fits_files([self.events_filename], downcast=args.get('downcast', False))
         elif 'events_list' in args:
             self.events_data = args['events_list']
         elif 'heatmap' in args:
             self.events_data = args['events_list']
         self.events_list_checks()
+        self.events_index = TimeIndexedEvents(self.events_data)
+        self.events_data = self.events_index.events_data
+        if args.get('spatial_index', False):
+            self.build_spatial_index()
 
     def get_event_data_type(self):
         '''Return which event data is in use: observation list ("events_list") or events file ("events_filename").
@@ -106,25 +557,91 @@ class Photometrics():
         return self
 
     @staticmethod
-    def load_data_from_fits_file(filename):
+    def load_data_from_fits_file(filename, columns=None, downcast=False):
         """Load events extension data from a fits file.
 
         Parameter
         ---------
         filename : str
             path to a FITS file
+        columns : list or None
+            columns to load into a compact np.recarray, None to return the whole EVENTS table
+        downcast : bool
+            store floating point columns (except TIME) as float32, only with columns
 
         Returns
         -------
         data : ndarray 
             EVENTS data 
         """
+        if columns is not None:
+            return Photometrics.load_data_from_fits_files([filename], columns=columns, downcast=downcast)
         with fits.open(filename, mode='readonly') as hdul:
             data = hdul['EVENTS'].data
         return data
 
-    def heatmap_region_counter(self, input_center, input_radius, binning, wcs=None):
-        """Count photons in an input area.
+    @staticmethod
+    def load_data_from_fits_files(filenames, columns=EVENTS_COLUMNS, downcast=False):
+        """Load the selected columns of the events extension of many fits files (e.g. the runs of an observation list) into a single preallocated np.recarray. The files are memory-mapped and only the required columns are copied.
+
+        Parameter
+        ---------
+        filenames : list
+            paths to FITS files
+        columns : list
+            columns to load
+        downcast : bool
+            store floating point columns (except TIME) as float32
+
+        Returns
+        -------
+        data : np.recarray 
+            EVENTS data of all files
+        """
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        if len(filenames) == 0:
+            raise ValueError('Need at least one FITS file to load events from.')
+        columns = list(columns)
+        # read headers first to size the buffer
+        lengths = []
+        formats = None
+        for filename in filenames:
+            with fits.open(filename, mode='readonly', memmap=True) as hdul:
+                lengths.append(hdul['EVENTS'].header['NAXIS2'])
+                if formats is None:
+                    formats = [hdul['EVENTS'].data.dtype[c].newbyteorder('=') for c in columns]
+        if downcast:
+            formats = [np.dtype(np.float32) if f.kind == 'f' and c != 'TIME' else f for c, f in zip(columns, formats)]
+        data = np.empty(sum(lengths), dtype={'names': columns, 'formats': formats}).view(np.recarray)
+        # fill the buffer file by file
+        start = 0
+        for filename, length in zip(filenames, lengths):
+            if length == 0:
+                continue
+            with fits.open(filename, mode='readonly', memmap=True) as hdul:
+                events = hdul['EVENTS'].data
+                for c in columns:
+                    data[c][start:start+length] = events[c]
+                del events
+            start += length
+        return data
+
+    def build_spatial_index(self):
+        """Build the spatial index (KD-tree on the events unit vectors) used by all region queries. It pays off when many positions are queried on the same events list, e.g. blind-search candidates.
+
+        Parameter
+        ---------
+
+        Return
+        ------
+
+        """
+        self.events_index.build_spatial_index()
+        return self
+
+    def heatmap_region_counter(self, input_center, input_radius, binning=None, wcs=None):
+        """Count photons in an input area via the spatial index, which is built on first use.
         
         Parameter
         ---------
@@ -132,6 +649,10 @@ class Photometrics():
             region center coordinates with (ra, dec) in degrees
         input_radius : float or astropy Angle
             region radius in degrees
+        binning : int or None
+            unused, kept for backward compatibility
+        wcs : astropy WCS or None
+            unused, kept for backward compatibility
         
         Return
         ------
@@ -139,16 +660,94 @@ class Photometrics():
             counts in the region
         """
         region_center = utils.get_skycoord(input_center)
-        region_radius = utils.get_angle(input_radius)
+        region = {'ra': region_center.ra.deg, 'dec': region_center.dec.deg, 'rad': utils.get_angle(input_radius).deg}
+        return self.events_index.indexed_count_regions([region])[0]
 
-        # events coordinates from the selected events list
-        ra, dec = np.arange(binning+1), np.arange(binning+1)
-        if wcs is not None:
-            ra, dec = wcs.world_to_pixel(SkyCoord(ra, dec, unit='deg', frame='icrs'))
-        else:
-            events_coords = SkyCoord(ra, dec, unit='deg', frame='icrs')
-        distances = region_center.separation(events_coords)
-        return np.count_nonzero(distances < region_radius)
+    def candidates_counter(self, candidates, input_radius, emin=None, emax=None, tmin=None, tmax=None):
+        """Count photons around many candidate positions via the spatial index, which is built on first use.
+
+        Parameter
+        ---------
+        candidates : list
+            candidates coordinates as dict or tuple or list with (ra, dec) in degrees
+        input_radius : float or astropy Angle
+            region radius in degrees
+        emin : float or None
+            minimum energy selection cut
+        emax : float or None
+            maximum energy selection cut
+        tmin : float or None
+            minimum time selection cut
+        tmax : float or None
+            maximum time selection cut
+
+        Return
+        ------
+        counts : ndarray
+            integer counts for each candidate
+        """
+        radius = utils.get_angle(input_radius).deg
+        regions = []
+        for c in candidates:
+            center = utils.get_skycoord(c)
+            regions.append({'ra': center.ra.deg, 'dec': center.dec.deg, 'rad': radius})
+        return self.events_index.indexed_count_regions(regions, emin=emin, emax=emax, tmin=tmin, tmax=tmax)
+
+    def selection_mask(self, emin=None, emax=None, tmin=None, tmax=None):
+        """Boolean mask of the events within the energy and time selection cuts.
+
+        Parameter
+        ---------
+        emin : float or None
+            minimum energy selection cut
+        emax : float or None
+            maximum energy selection cut
+        tmin : float or None
+            minimum time selection cut
+        tmax : float or None
+            maximum time selection cut
+
+        Return
+        ------
+        mask : ndarray
+            boolean mask of the selected events
+        """
+        # FIXME: TIME needs a better implementation
+        # atm it consider users that knows the time format in the input fits
+        window = self.events_index.time_slice(tmin=tmin, tmax=tmax)
+        condlist = np.full(len(self.events_data), False)
+        condlist[window] = True
+        # ... w/ energy boundaries
+        mask = self.events_index.energy_mask(window, emin=emin, emax=emax)
+        if mask is not None:
+            condlist[window] = mask
+        return condlist
+
+    def count_regions(self, regions, emin=None, emax=None, tmin=None, tmax=None):
+        """Count photons in many regions at once. The energy and time selection is applied once and the events unit vectors are computed once, then all regions are counted with a single matrix product.
+
+        Parameter
+        ---------
+        regions : list
+            list of regions dictionary with ra, dec, rad in degrees
+        emin : float or None
+            minimum energy selection cut
+        emax : float or None
+            maximum energy selection cut
+        tmin : float or None
+            minimum time selection cut
+        tmax : float or None
+            maximum time selection cut
+
+        Return
+        ------
+        counts : ndarray
+            integer counts for each region, in the same order of the input
+        """
+        if self.events_index.tree is not None:
+            return self.events_index.indexed_count_regions(regions, emin=emin, emax=emax, tmin=tmin, tmax=tmax)
+        vectors = self.events_index.selected_vectors(emin=emin, emax=emax, tmin=tmin, tmax=tmax)
+        return count_in_regions(vectors, regions)
 
     def region_counter(self, input_center, input_radius, emin=None, emax=None, tmin=None, tmax=None):
         """Count photons in an input area.
@@ -175,24 +774,18 @@ class Photometrics():
         """
         region_center = utils.get_skycoord(input_center)
         region_radius = utils.get_angle(input_radius)
+        if self.events_index.tree is not None:
+            region = {'ra': region_center.ra.deg, 'dec': region_center.dec.deg, 'rad': region_radius.deg}
+            return self.events_index.indexed_count_regions([region], emin=emin, emax=emax, tmin=tmin, tmax=tmax)[0]
 
         # filtering...
-        condlist = np.full(len(self.events_data.field('ENERGY')), True)
-        # ... w/ energy boundaries
-        if emin is not None:
-            condlist &= self.events_data.field('ENERGY') >= emin
-        if emax is not None:
-            condlist &= self.events_data.field('ENERGY') <= emax
-        # FIXME: TIME needs a better implementation
-        # atm it consider users that knows the time format in the input fits
-        if tmin is not None:
-            condlist &= self.events_data.field('TIME') >= tmin
-        if tmax is not None:
-            condlist &= self.events_data.field('TIME') <= tmax
-
-        events_list = np.extract(condlist, self.events_data)
+        window = self.events_index.time_slice(tmin=tmin, tmax=tmax)
+        events_list = self.events_data[window]
+        mask = self.events_index.energy_mask(window, emin=emin, emax=emax)
+        if mask is not None:
+            events_list = events_list[mask]
         # events coordinates from the selected events list
-        events_coords = SkyCoord(events_list.field('RA'), events_list.field('DEC'), unit='deg', frame='icrs')
+        events_coords = SkyCoord(events_list['RA'], events_list['DEC'], unit='deg', frame='icrs')
         distances = region_center.separation(events_coords)
         return np.count_nonzero(distances < region_radius)
 
@@ -261,30 +854,7 @@ class Photometrics():
         regions : list
             list of regions dictionary with ra, dec, rad in degrees
         """
-        pointing_center = utils.get_skycoord(input_pointing_center)
-        region_center = utils.get_skycoord(input_region_center)
-        region_radius = utils.get_angle(input_region_radius)
-
-        # Angular separation of reflected regions. 1.05 factor is to have a margin
-        region_diameter = 1.05 * 2.0 * region_radius
-        radius = pointing_center.separation(region_center)
-        # the numbers_of_reflected regions is the number of center that can stay
-        # on the circumference, NOT the really computated number of regions.
-        numbers_of_reflected_regions = int(2 * np.pi * radius / region_diameter)
-        # Indeed, we skip the source region and the two near (see below), so we
-        # need at least 4 centers to get one off region.
-        if numbers_of_reflected_regions < 4:
-            raise Exception('the combination of region radius and coordinates does not allow to compute reflected regions.')
-        regions_offset_angle = Angle(360, unit='deg') / numbers_of_reflected_regions
-        
-        regions = []
-        # starting from the source region 0, we skip region 1 and region N, so 2..N-1
-        starting_pos_angle = pointing_center.position_angle(region_center)
-        for i in range(2, numbers_of_reflected_regions-1):
-            theta = starting_pos_angle + i * regions_offset_angle
-            coord_pos = pointing_center.directional_offset_by(theta, radius)
-            regions.append({ 'ra': coord_pos.ra.deg, 'dec': coord_pos.dec.deg, 'rad': region_radius.deg })
-        return regions
+        return cached_off_regions('reflection', input_pointing_center, input_region_center, input_region_radius)
 
     @classmethod
     def reflected_regions(self, pointing, target, region_radius, skip_adjacent=True, min_regions_number=4):
@@ -381,17 +951,7 @@ class Photometrics():
             list of regions dictionary with ra, dec, rad in degrees
         """
         # FIXME Wobble algorithm has no check about distance and region radius.
-        pointing_center = utils.get_skycoord(input_pointing_center)
-        region_center = utils.get_skycoord(input_region_center)
-        region_radius = utils.get_angle(input_region_radius)
-        radius = pointing_center.separation(region_center)
-        starting_pos_angle = pointing_center.position_angle(region_center)
-        regions = []
-        for i in range(1,4):
-            theta = starting_pos_angle + i * Angle(90, unit='deg')
-            coord_pos = pointing_center.directional_offset_by(theta, radius)
-            regions.append({ 'ra': coord_pos.ra.deg, 'dec': coord_pos.dec.deg, 'rad': region_radius.deg })
-        return regions
+        return cached_off_regions('cross', input_pointing_center, input_region_center, input_region_radius)
 
     @classmethod
     def cross_regions(self, pointing, target, region_radius):
@@ -494,11 +1054,10 @@ class Photometrics():
         err_note : str or None
             error message
         '''
-        on_count = self.region_counter(src, rad, emin=e_min, emax=e_max, tmin=t_min, tmax=t_max)
-        off_count = 0
-        # compute off counts
-        for r in off_regions:
-            off_count += self.region_counter(r, r['rad'], emin=e_min, emax=e_max, tmin=t_min, tmax=t_max)
+        # on region first, then all off regions in a single pass
+        counts = self.count_regions(on_and_off_regions(src, rad, off_regions), emin=e_min, emax=e_max, tmin=t_min, tmax=t_max)
+        on_count = counts[0]
+        off_count = counts[1:].sum()
 
         alpha = 1 / len(off_regions)
         excess = on_count - alpha * off_count
@@ -533,13 +1092,7 @@ class Photometrics():
         if not len(pnt) == 2 and len(src) == 2:
             raise Exception('need source and pointing coordinates and a region radius to do aperture photometry')
 
-        off_regions = None
-        if algo.lower() == 'cross' or algo.lower() == 'wobble':
-            off_regions = self.cross_regions(pnt, src, rad)
-        elif algo.lower() == 'reflection':
-            off_regions = self.reflected_regions_with_astropy(pnt, src, rad)
-        else:
-            raise Exception('invalid background regions algorithm')
+        off_regions = cached_off_regions(algo, pnt, src, rad, skip_adjacent=skip_adjacent)
 
         if save:
             self.write_region(off_regions, save, color='red', dash=True, width=2)
@@ -587,11 +1140,10 @@ def photometrics_counts(events_list, events_type, pointing, target_coords, regio
         photometric results with on, off, excess counts and alpha parameter
     '''
     phm = Photometrics({events_type: events_list})
-    reflected_regions = phm.reflected_regions(pointing, target_coords, region_rad, skip_adjacent)
-    on_count = phm.region_counter(target_coords, region_rad)
-    off_count = 0
-    for r in reflected_regions:
-        off_count += phm.region_counter(r, r['rad'])
+    reflected_regions = cached_off_regions('reflection', pointing, target_coords, region_rad, skip_adjacent)
+    counts = phm.count_regions(on_and_off_regions(target_coords, region_rad, reflected_regions))
+    on_count = counts[0]
+    off_count = counts[1:].sum()
     alpha = 1 / len(reflected_regions)
     return {'on': on_count, 'off': off_count, 'alpha': alpha, 'excess': on_count - alpha * off_count}
 
@@ -757,7 +1309,7 @@ def get_exposure_in_region(target, pointing, trange, erange, irf, index, bkg_met
         region exposure in cm2/s
     '''
     args = phm_options(erange=erange, trange=trange, target=target, pointing=pointing, irf_file=irf, index=index, bkg_method=bkg_method)
-    region_eff_resp = aeff_eval(args, src=target, pnt=pointing)
+    region_eff_resp = aph_irf.aeff_eval(args, src=target, pnt=pointing)
     livetime = trange[1]-trange[0]
     exposure = region_eff_resp * livetime
     return exposure
@@ -788,7 +1340,7 @@ def get_aeff_in_region(target, pointing, trange, erange, irf, index, bkg_method=
         effective area in cm2
     '''
     args = phm_options(erange=erange, trange=trange, target=target, pointing=pointing, irf_file=irf, index=index, bkg_method=bkg_method)
-    region_eff_resp = aeff_eval(args, src=target, pnt=pointing)
+    region_eff_resp = aph_irf.aeff_eval(args, src=target, pnt=pointing)
     return region_eff_resp
 
 
@@ -825,3 +1377,7 @@ def get_prefactor_from_bkg_and_sigma(sigma, bkg, target, pointing, trange, erang
     flux = excess / exposure 
     prefactor = utils.get_prefactor(flux=flux, erange=erange, gamma=spectral_index, unit='TeV')
     return prefactor
+
+# utils imports the names of this module, so it is imported once they are defined
+from rtasci.aph import utils
+from rtasci.aph import irf as aph_irf
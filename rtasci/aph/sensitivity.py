@@ -0,0 +1,190 @@
+# *******************************************************************************
+# Copyright (C) 2021 INAF
+#
+# This software is distributed under the terms of the BSD-3-Clause license
+#
+# Authors:
+# Ambra Di Piano <ambra.dipiano@inaf.it>
+# Simone Tampieri <simone.tampieri@inaf.it>
+# *******************************************************************************
+
+import numpy as np
+from collections import OrderedDict
+from scipy import integrate
+from rtasci.aph.utils import excess_from_sigma_and_bkg_array, get_prefactor
+from rtasci.aph.irf import get_irf
+from rtasci.aph.cache import irf_content_hash
+
+# MeV to erg conversion
+MEV_TO_ERG = 1.602176634e-6
+
+def energy_bins(erange, nbins, sens_type='differential'):
+    '''Energy bins of the sensitivity curve, as cssens: nbins log-spaced bins for the differential sensitivity, or the same lower edges up to emax for the integral sensitivity.
+
+    Parameter
+    ---------
+    erange : list
+        energy interval with [emin, emax] in TeV
+    nbins : int
+        number of energy bins
+    sens_type : str
+        "differential" or "integral"
+
+    Return
+    ------
+    emin : ndarray
+        lower edge of each bin in TeV
+    emax : ndarray
+        upper edge of each bin in TeV
+    '''
+    edges = np.logspace(np.log10(erange[0]), np.log10(erange[1]), nbins + 1)
+    if sens_type.lower() == 'differential':
+        return edges[:-1], edges[1:]
+    elif sens_type.lower() == 'integral':
+        return edges[:-1], np.full(nbins, edges[-1])
+    else:
+        raise Exception('Invalid sensitivity type {}, use "differential" or "integral"'.format(sens_type))
+
+def min_excess(sigma, bkg, alpha=0.2, excess_min=None, bkg_fraction=None):
+    '''Minimum excess counts for a detection, broadcasting over arrays.
+
+    Parameter
+    ---------
+    sigma : float or array
+        target Li & Ma significance
+    bkg : float or array
+        expected background counts in the on region
+    alpha : float
+        alpha parameter
+    excess_min : float or None
+        minimum number of excess counts
+    bkg_fraction : float or None
+        minimum excess as a fraction of the background counts, for background systematics
+
+    Return
+    ------
+    excess : ndarray
+        minimum excess counts
+    '''
+    excess = excess_from_sigma_and_bkg_array(sigma, bkg, alpha)
+    if excess_min is not None:
+        excess = np.maximum(excess, excess_min)
+    if bkg_fraction is not None:
+        excess = np.maximum(excess, bkg_fraction * np.asarray(bkg, dtype=float))
+    return excess
+
+# response and background rate tables, keyed by IRF content and grid
+_rate_tables = OrderedDict()
+
+# number of tables kept by rate_tables
+RATE_TABLES_CACHE_SIZE = 64
+
+def rate_tables(irf_file, offsets, emin, emax, rad=0.2, index=-2.4, nbin=100, pixel_size=0.05):
+    '''Spectrum-weighted on region response and background rate for each offset and energy bin. The response is the effective area times the psf containment within rad, averaged over the bin with a power law of the given index. The tables are cached per IRF content and grid.
+
+    Parameter
+    ---------
+    irf_file : str
+        path to IRF in FITS format
+    offsets : array
+        source offsets from the pointing in degrees
+    emin : array
+        lower edge of each energy bin in TeV
+    emax : array
+        upper edge of each energy bin in TeV
+    rad : float
+        on region radius in degrees
+    index : float
+        powerlaw spectral index
+    nbin : int
+        number of points of the log energy integration grid of each bin
+    pixel_size : float
+        size of a pixel in degrees for the background integration
+
+    Return
+    ------
+    response : ndarray
+        on region response in [cm2] with shape (offsets, bins)
+    background : ndarray
+        on region background rate in [s-1] with shape (offsets, bins)
+    '''
+    offsets = np.atleast_1d(np.asarray(offsets, dtype=np.float64))
+    emin, emax = np.atleast_1d(np.asarray(emin, dtype=np.float64)), np.atleast_1d(np.asarray(emax, dtype=np.float64))
+    key = (irf_content_hash(irf_file), tuple(offsets), tuple(emin), tuple(emax), float(rad), float(index), nbin, float(pixel_size))
+    if key in _rate_tables:
+        _rate_tables.move_to_end(key)
+        return _rate_tables[key]
+    irf = get_irf(irf_file)
+    # log energy grid of each bin with shape (bins, nbin)
+    grid = np.logspace(np.log10(emin), np.log10(emax), nbin, axis=-1)
+    thetas = offsets[:, np.newaxis, np.newaxis]
+    # these IRFs return value in m², so we need convert
+    response = irf.effective_area().aeff(thetas, grid) * irf.psf().containment(thetas, grid, rad) * 1e4 # cm2
+    weights = grid**index
+    response = integrate.trapezoid(response * weights, grid, axis=-1) / integrate.trapezoid(weights, grid, axis=-1)
+    # the on regions lie at the given offsets north of a pointing at the origin
+    regions = [{'ra': 0.0, 'dec': float(offset), 'rad': float(rad)} for offset in offsets]
+    background = irf.background()
+    rates = np.column_stack([background.region_rates(regions, {'ra': 0.0, 'dec': 0.0}, [lo, hi], pixel_size) for lo, hi in zip(emin, emax)])
+    response.flags.writeable = False
+    rates.flags.writeable = False
+    _rate_tables[key] = (response, rates)
+    while len(_rate_tables) > RATE_TABLES_CACHE_SIZE:
+        _rate_tables.popitem(last=False)
+    return response, rates
+
+def sensitivity(irf_files, exposures, offsets, erange, nbins=10, sens_type='differential', sigma=5, alpha=0.2, excess_min=None, bkg_fraction=None, rad=0.2, index=-2.4, e0=1, pixel_size=0.05):
+    '''Minimum detectable power law for every IRF, offset, energy bin and exposure, solving the Asimov Li & Ma significance for the excess counts instead of simulating and fitting as cssens does. Energy dispersion is neglected.
+
+    Parameter
+    ---------
+    irf_files : str or list
+        paths to IRFs in FITS format
+    exposures : float or array
+        exposures in seconds
+    offsets : float or array
+        source offsets from the pointing in degrees
+    erange : list
+        energy interval with [emin, emax] in TeV
+    nbins : int
+        number of energy bins
+    sens_type : str
+        "differential" or "integral"
+    sigma : float
+        target Li & Ma significance
+    alpha : float
+        alpha parameter, 1 / number of off regions
+    excess_min : float or None
+        minimum number of excess counts
+    bkg_fraction : float or None
+        minimum excess as a fraction of the background counts
+    rad : float
+        on region radius in degrees
+    index : float
+        powerlaw spectral index
+    e0 : float
+        pivot energy of the prefactor in TeV
+    pixel_size : float
+        size of a pixel in degrees for the background integration
+
+    Return
+    ------
+    sensitivity : dict
+        energy bins edges, and excess, background, flux [ph/cm2/s], prefactor [ph/cm2/s/MeV] and e2dnde at the bin geometric center [erg/cm2/s] with shape (irfs, offsets, bins, exposures)
+    '''
+    if isinstance(irf_files, str):
+        irf_files = [irf_files]
+    exposures = np.atleast_1d(np.asarray(exposures, dtype=np.float64))
+    offsets = np.atleast_1d(np.asarray(offsets, dtype=np.float64))
+    emin, emax = energy_bins(erange, nbins, sens_type)
+    tables = [rate_tables(irf_file, offsets, emin, emax, rad=rad, index=index, pixel_size=pixel_size) for irf_file in irf_files]
+    response = np.stack([t[0] for t in tables])[..., np.newaxis]
+    background = np.stack([t[1] for t in tables])[..., np.newaxis] * exposures
+    excess = min_excess(sigma, background, alpha=alpha, excess_min=excess_min, bkg_fraction=bkg_fraction)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        flux = np.where(response > 0, excess / (response * exposures), np.nan)
+    bins = (emin[:, np.newaxis], emax[:, np.newaxis])
+    prefactor = get_prefactor(flux, bins, gamma=index, e0=e0, unit='TeV')
+    energy = np.sqrt(emin * emax)[:, np.newaxis] * 1e6 # MeV
+    e2dnde = prefactor * (energy / (e0 * 1e6))**index * energy**2 * MEV_TO_ERG
+    return {'emin': emin, 'emax': emax, 'excess': excess, 'background': background, 'flux': flux, 'prefactor': prefactor, 'e2dnde': e2dnde}
@@ -0,0 +1,247 @@
+# *******************************************************************************
+# Copyright (C) 2021 INAF
+#
+# This software is distributed under the terms of the BSD-3-Clause license
+#
+# Authors:
+# Ambra Di Piano <ambra.dipiano@inaf.it>
+# Simone Tampieri <simone.tampieri@inaf.it>
+# *******************************************************************************
+
+import numpy as np
+from astropy.wcs import WCS
+from scipy.signal import fftconvolve
+from rtasci.aph import utils
+
+def disk_kernel(radius, pixel_size):
+    '''Top-hat kernel of all pixels whose center is within radius from the kernel center.
+
+    Parameter
+    ---------
+    radius : float
+        kernel radius in degrees
+    pixel_size : float
+        pixel size in degrees
+
+    Return
+    ------
+    kernel : ndarray
+        odd sized kernel with ones inside the disk and zeros outside
+    '''
+    return ring_kernel(0, radius, pixel_size)
+
+def ring_kernel(inner_radius, outer_radius, pixel_size):
+    '''Top-hat kernel of all pixels whose center is within [inner_radius, outer_radius] from the kernel center.
+
+    Parameter
+    ---------
+    inner_radius : float
+        ring inner radius in degrees
+    outer_radius : float
+        ring outer radius in degrees
+    pixel_size : float
+        pixel size in degrees
+
+    Return
+    ------
+    kernel : ndarray
+        odd sized kernel with ones inside the ring and zeros outside
+    '''
+    half = int(np.ceil(outer_radius / pixel_size))
+    y, x = np.mgrid[-half:half+1, -half:half+1]
+    distance = np.hypot(x, y) * pixel_size
+    return ((distance >= inner_radius) & (distance <= outer_radius)).astype(float)
+
+def convolve_counts(counts, kernel):
+    '''Sum the counts image over the kernel footprint centered on each pixel via FFT.
+
+    Parameter
+    ---------
+    counts : ndarray
+        counts image
+    kernel : ndarray
+        odd sized top-hat kernel
+
+    Return
+    ------
+    convolved : ndarray
+        integer valued counts within the kernel around each pixel
+    '''
+    convolved = fftconvolve(counts, kernel, mode='same')
+    # the FFT leaves floating point noise on integer sums
+    return np.maximum(np.rint(convolved), 0)
+
+class SignificanceMap():
+    '''Full field of view aperture photometry on a WCS grid. The selected events are binned once into a counts image around the pointing, which is convolved via FFT with a top-hat of the on region radius: each pixel of the result holds the on counts of a region centered on that pixel. Off counts are estimated with a ring around each pixel or by summing the on image at the reflected positions of each pixel.
+
+    Parameter
+    ---------
+    phm : Photometrics
+        photometry object holding the events of the trial
+    pointing : dict or tuple or list
+        pointing coordinates with (ra, dec) in degrees
+    rad : float
+        on region radius in degrees
+    width : float
+        map width in degrees
+    pixel_size : float
+        pixel size in degrees
+    inner_radius : float
+        ring inner radius in degrees
+    outer_radius : float
+        ring outer radius in degrees
+    emin : float or None
+        minimum energy selection cut
+    emax : float or None
+        maximum energy selection cut
+    tmin : float or None
+        minimum time selection cut
+    tmax : float or None
+        maximum time selection cut
+    '''
+    def __init__(self, phm, pointing, rad, width=5.0, pixel_size=0.02, inner_radius=0.6, outer_radius=0.8, emin=None, emax=None, tmin=None, tmax=None):
+        if inner_radius < rad or outer_radius <= inner_radius:
+            raise Exception('the ring must lie outside the on region and have a positive width')
+        pointing = utils.get_skycoord(pointing)
+        self.pointing = (pointing.ra.deg, pointing.dec.deg)
+        self.rad = rad
+        self.pixel_size = pixel_size
+        self.inner_radius = inner_radius
+        self.outer_radius = outer_radius
+        self.npix = int(np.ceil(width / pixel_size)) // 2 * 2 + 1
+        # the binned image covers the circle through the map corners plus the kernels reach, so that
+        # every on, ring and reflected region of the map pixels is fully inside it
+        half = (self.npix // 2) * pixel_size
+        self.margin = int(np.ceil((half * (np.sqrt(2) - 1) + max(rad, outer_radius)) / pixel_size)) + 1
+        self.binned_wcs = self.make_wcs(self.npix + 2 * self.margin)
+        self.wcs = self.make_wcs(self.npix)
+        mask = phm.selection_mask(emin=emin, emax=emax, tmin=tmin, tmax=tmax)
+        binned = self.bin_events(phm.events_data['RA'][mask], phm.events_data['DEC'][mask])
+        self.binned_on = convolve_counts(binned, disk_kernel(rad, pixel_size))
+        self.binned_ring = convolve_counts(binned, ring_kernel(inner_radius, outer_radius, pixel_size))
+        crop = (slice(self.margin, self.margin + self.npix),) * 2
+        self.counts = binned[crop]
+        self.on = self.binned_on[crop]
+        self.ring_off = self.binned_ring[crop]
+        self.ring_alpha = disk_kernel(rad, pixel_size).sum() / ring_kernel(inner_radius, outer_radius, pixel_size).sum()
+
+    def make_wcs(self, npix):
+        '''Gnomonic projection centered on the pointing with npix x npix pixels.'''
+        wcs = WCS(naxis=2)
+        wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN']
+        wcs.wcs.crval = list(self.pointing)
+        wcs.wcs.crpix = [(npix + 1) / 2, (npix + 1) / 2]
+        wcs.wcs.cdelt = [-self.pixel_size, self.pixel_size]
+        wcs.array_shape = (npix, npix)
+        return wcs
+
+    def bin_events(self, ra, dec):
+        '''Bin events coordinates into the counts image, events outside the image are dropped.
+
+        Parameter
+        ---------
+        ra : array
+            events right ascension in degrees
+        dec : array
+            events declination in degrees
+
+        Return
+        ------
+        counts : ndarray
+            counts image indexed as [y, x]
+        '''
+        npix = self.binned_wcs.array_shape[0]
+        x, y = self.binned_wcs.wcs_world2pix(np.asarray(ra, dtype=float), np.asarray(dec, dtype=float), 0)
+        x, y = np.rint(x), np.rint(y)
+        inside = (x >= 0) & (x < npix) & (y >= 0) & (y < npix)
+        pixels = y[inside].astype(np.int64) * npix + x[inside].astype(np.int64)
+        return np.bincount(pixels, minlength=npix * npix).reshape(npix, npix).astype(float)
+
+    def pixel_coordinates(self):
+        '''World coordinates of the map pixels centers.
+
+        Return
+        ------
+        ra : ndarray
+            right ascension image in degrees
+        dec : ndarray
+            declination image in degrees
+        '''
+        y, x = np.mgrid[0:self.npix, 0:self.npix]
+        return self.wcs.wcs_pix2world(x, y, 0)
+
+    def ring(self):
+        '''Photometric results of each pixel with the ring background.
+
+        Return
+        ------
+        photometry : dict
+            on, off, alpha, excess and Li & Ma significance images
+        '''
+        return self.photometry(self.on, self.ring_off, self.ring_alpha)
+
+    def reflected(self, skip_adjacent=True, min_regions_number=4):
+        '''Photometric results of each pixel with the reflected background. For each pixel the reflected regions follow reflected_regions and their counts are read from the on image at the rotated positions around the pointing. Pixels too close to the pointing to host min_regions_number regions are NaN.
+
+        Parameter
+        ---------
+        skip_adjacent : bool
+            skip the two regions adjacent to the on region
+        min_regions_number : int
+            minimum number of regions on the circle through the pixel
+
+        Return
+        ------
+        photometry : dict
+            on, off, alpha, excess and Li & Ma significance images
+        '''
+        center = self.npix // 2
+        y, x = np.mgrid[0:self.npix, 0:self.npix] - center
+        offset = np.hypot(x, y) * self.pixel_size
+        numbers = (2 * np.pi * offset / (1.05 * 2.0 * self.rad)).astype(np.int64)
+        first = 2 if skip_adjacent else 1
+        last = numbers - 1 if skip_adjacent else numbers
+        valid = (numbers >= min_regions_number) & (last > first)
+        off = np.zeros((self.npix, self.npix))
+        steps = 2 * np.pi / np.maximum(numbers, 1)
+        # rotations about the tangent point keep the angular distance from the pointing
+        for i in range(first, int(last.max(initial=first))):
+            use = valid & (i < last)
+            cos, sin = np.cos(i * steps[use]), np.sin(i * steps[use])
+            xr = np.rint(x[use] * cos - y[use] * sin).astype(np.int64) + center + self.margin
+            yr = np.rint(x[use] * sin + y[use] * cos).astype(np.int64) + center + self.margin
+            off[use] += self.binned_on[yr, xr]
+        alpha = np.full((self.npix, self.npix), np.nan)
+        alpha[valid] = 1 / (last[valid] - first)
+        off[~valid] = np.nan
+        return self.photometry(self.on, off, alpha)
+
+    @staticmethod
+    def photometry(on, off, alpha):
+        '''Photometric results images from on, off and alpha images.'''
+        return {'on': on, 'off': off, 'alpha': alpha, 'excess': utils.get_excess_array(on, off, alpha), 'sigma': utils.li_ma_array(on, off, alpha)}
+
+    def value_at(self, image, coords):
+        '''Value of a map image at the pixel containing coords.
+
+        Parameter
+        ---------
+        image : ndarray
+            map image
+        coords : dict or tuple or list
+            coordinates with (ra, dec) in degrees
+
+        Return
+        ------
+        value : float
+            image value, NaN outside the map
+        '''
+        coords = utils.get_skycoord(coords)
+        x, y = self.wcs.wcs_world2pix(coords.ra.deg, coords.dec.deg, 0)
+        # coordinates outside the projection have no pixel
+        if not (np.isfinite(x) and np.isfinite(y)):
+            return np.nan
+        x, y = int(np.rint(x)), int(np.rint(y))
+        if not (0 <= x < self.npix and 0 <= y < self.npix):
+            return np.nan
+        return image[y, x]
@@ -12,68 +12,121 @@ import csv
 import math
 import numpy as np
 from astropy.coordinates import SkyCoord, Angle
-from rtasci.aph.photometry import Photometrics
-from rtasci.aph.irf import EffectiveArea
+from rtasci.aph.photometry import Photometrics, on_and_off_regions, cached_off_regions
+from rtasci.aph import skymap
+from rtasci.aph import irf as aph_irf
 
 def photometrics_counts(events_list, events_type, pointing, true_coords, region_rad=0.2, skip_adjacent=True, min_regions_number=4, emin=None, emax=None, tmin=None, tmax=None):
   phm = Photometrics({events_type: events_list})
-  reflected_regions = phm.reflected_regions(pointing, true_coords, region_rad, skip_adjacent, min_regions_number)
-  on_count = phm.region_counter(true_coords, region_rad, tmin=tmin, tmax=tmax, emin=emin, emax=emax)
-  off_count = 0
-  for r in reflected_regions:
-    off_count += phm.region_counter(r, r['rad'], tmin=tmin, tmax=tmax, emin=emin, emax=emax)
+  reflected_regions = cached_off_regions('reflection', pointing, true_coords, region_rad, skip_adjacent, min_regions_number)
+  counts = phm.count_regions(on_and_off_regions(true_coords, region_rad, reflected_regions), tmin=tmin, tmax=tmax, emin=emin, emax=emax)
+  on_count = counts[0]
+  off_count = counts[1:].sum()
   alpha = 1 / len(reflected_regions)
   return {'on': on_count, 'off': off_count, 'alpha': alpha, 'excess': on_count - alpha * off_count, 'regions': reflected_regions}
 
-def heatmap_photometrics_counts(events_list, events_type, pointing, true_coords, region_rad=0.2, skip_adjacent=True, min_regions_number=4, binning=200):
+def heatmap_photometrics_counts(events_list, events_type, pointing, true_coords, region_rad=0.2, skip_adjacent=True, min_regions_number=4, binning=200, width=5.0, emin=None, emax=None, tmin=None, tmax=None):
   phm = Photometrics({events_type: events_list})
-  reflected_regions = phm.reflected_regions(pointing, true_coords, region_rad, skip_adjacent, min_regions_number)
-  on_count = phm.heatmap_region_counter(true_coords, region_rad, binning)
-  off_count = 0
-  for r in reflected_regions:
-    off_count += phm.heatmap_region_counter(r, r['rad'])
-  alpha = 1 / len(reflected_regions)
-  return {'on': on_count, 'off': off_count, 'alpha': alpha, 'excess': on_count - alpha * off_count, 'regions': reflected_regions}
+  reflected_regions = cached_off_regions('reflection', pointing, true_coords, region_rad, skip_adjacent, min_regions_number)
+  heatmap = skymap.SignificanceMap(phm, pointing, region_rad, width=width, pixel_size=width/binning, emin=emin, emax=emax, tmin=tmin, tmax=tmax)
+  maps = heatmap.reflected(skip_adjacent=skip_adjacent, min_regions_number=min_regions_number)
+  on_count = heatmap.value_at(maps['on'], true_coords)
+  off_count = heatmap.value_at(maps['off'], true_coords)
+  alpha = heatmap.value_at(maps['alpha'], true_coords)
+  return {'on': on_count, 'off': off_count, 'alpha': alpha, 'excess': on_count - alpha * off_count, 'regions': reflected_regions, 'maps': maps, 'wcs': heatmap.wcs}
+
+def li_ma_array(n_on, n_off, alpha):
+    '''Li & Ma significance broadcasting over arrays of n_on, n_off and alpha. Entries with n_on <= 0, n_off <= 0, alpha == 0 or NaN inputs are NaN.'''
+    n_on, n_off, alpha = np.broadcast_arrays(np.asarray(n_on, dtype=float), np.asarray(n_off, dtype=float), np.asarray(alpha, dtype=float))
+    valid = (n_on > 0) & (n_off > 0) & (alpha != 0) & np.isfinite(alpha)
+    sigma = np.full(n_on.shape, np.nan)
+    on, off, a = n_on[valid], n_off[valid], alpha[valid]
+    f = (1 + a) / a * on / (on + off)
+    g = (1 + a) * off / (on + off)
+    fullb = on * np.log(f) + off * np.log(g)
+    # rounding can give tiny negative values when n_on = alpha * n_off
+    sigma[valid] = np.sqrt(2) * np.sqrt(np.maximum(fullb, 0))
+    return sigma
 
 def li_ma (n_on, n_off, alpha):
-    if n_on <= 0 or n_off <= 0 or alpha == 0:
-        return np.nan
-    fc = (1 + alpha) / alpha
-    fb = n_on / (n_on + n_off)
-    f  = fc * fb
-    gc = 1 + alpha
-    gb = n_off / (n_on + n_off)
-    g  = gc * gb
-    first  = n_on * math.log(f)
-    second = n_off * math.log(g)
-    fullb   = first + second
-    return math.sqrt(2) * math.sqrt(fullb)
+    return float(li_ma_array(n_on, n_off, alpha))
+
+def get_excess_array(n_on, n_off, alpha):
+    '''Excess counts broadcasting over arrays of n_on, n_off and alpha.'''
+    return np.asarray(n_on, dtype=float) - np.asarray(alpha, dtype=float) * np.asarray(n_off, dtype=float)
 
 def get_excess(n_on, n_off, alpha):
     return n_on - alpha * n_off
 
+def get_excess_error_array(n_on, n_off):
+    '''Excess counts error broadcasting over arrays of n_on and n_off.'''
+    return np.sqrt(np.asarray(n_on, dtype=float) + np.asarray(n_off, dtype=float))
+
 def get_excess_error(n_on, n_off):
     dE = np.sqrt(np.sqrt(n_on)**2 + np.sqrt(n_off)**2)
     return dE
 
-def li_ma_error(n_on, n_off, alpha):
-    if n_on <= 0 or n_off <= 0 or alpha == 0:
-        return np.nan
-    dE = np.sqrt(n_on**2 + n_off**2)
-    A = n_on / (n_on + n_off)
-    dA = np.abs(A) * np.sqrt((np.sqrt(n_on)/n_on)**2 + (dE/(n_on+n_off)**2))
-    B = n_off / (n_on + n_off)
-    dB = np.abs(B) * np.sqrt((np.sqrt(n_off)/n_off)**2 + (dE/(n_on+n_off)**2))
-    lnA = np.log((alpha+1)/alpha * n_on/(n_on+n_off))
-    dlnA = dA / lnA
-    lnB = np.log((alpha+1)*n_off/(n_on+n_off))
-    dlnB = dB / lnB
-    don = np.abs(n_on*lnA) * np.sqrt((np.sqrt(n_on)/n_on)**2 + (dlnA/lnA)**2)
-    doff = np.abs(n_off*lnB) * np.sqrt((np.sqrt(n_off)/n_off)**2 + (dlnB/lnB)**2)
-    dsum = np.sqrt(don**2 + doff**2)
-    error = 0.5 * np.sqrt(n_on*lnA + n_off*lnB) * dsum/(n_on*lnA + n_off*lnB)
+def li_ma_error_array(n_on, n_off, alpha):
+    '''Li & Ma significance error broadcasting over arrays of n_on, n_off and alpha. Entries with n_on <= 0, n_off <= 0, alpha == 0 or NaN inputs are NaN.'''
+    n_on, n_off, alpha = np.broadcast_arrays(np.asarray(n_on, dtype=float), np.asarray(n_off, dtype=float), np.asarray(alpha, dtype=float))
+    valid = (n_on > 0) & (n_off > 0) & (alpha != 0) & np.isfinite(alpha)
+    error = np.full(n_on.shape, np.nan)
+    on, off, a = n_on[valid], n_off[valid], alpha[valid]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dE = np.sqrt(on**2 + off**2)
+        A = on / (on + off)
+        dA = np.abs(A) * np.sqrt((np.sqrt(on)/on)**2 + (dE/(on+off)**2))
+        B = off / (on + off)
+        dB = np.abs(B) * np.sqrt((np.sqrt(off)/off)**2 + (dE/(on+off)**2))
+        lnA = np.log((a+1)/a * on/(on+off))
+        dlnA = dA / lnA
+        lnB = np.log((a+1)*off/(on+off))
+        dlnB = dB / lnB
+        don = np.abs(on*lnA) * np.sqrt((np.sqrt(on)/on)**2 + (dlnA/lnA)**2)
+        doff = np.abs(off*lnB) * np.sqrt((np.sqrt(off)/off)**2 + (dlnB/lnB)**2)
+        dsum = np.sqrt(don**2 + doff**2)
+        error[valid] = 0.5 * np.sqrt(on*lnA + off*lnB) * dsum/(on*lnA + off*lnB)
     return error
 
+def li_ma_error(n_on, n_off, alpha):
+    return float(li_ma_error_array(n_on, n_off, alpha))
+
+def excess_from_sigma_and_bkg_array(sigma, bkg, alpha=0.2, iterations=100):
+    '''Excess counts giving the Li & Ma significance sigma over the expected background counts bkg in the on region (Asimov off counts bkg / alpha), broadcasting over arrays. The significance grows with the excess, so the root is found by a vectorized bisection. Entries with sigma <= 0 or bkg <= 0 are NaN.'''
+    sigma, bkg, alpha = np.broadcast_arrays(np.asarray(sigma, dtype=float), np.asarray(bkg, dtype=float), np.asarray(alpha, dtype=float))
+    valid = (sigma > 0) & (bkg > 0) & (alpha > 0)
+    excess = np.full(sigma.shape, np.nan)
+    s, b, a = sigma[valid], bkg[valid], alpha[valid]
+    low = np.zeros(s.shape)
+    # gaussian guess, doubled until it brackets the root
+    high = s * np.sqrt(b) + s**2
+    while True:
+        short = li_ma_array(high + b, b / a, a) < s
+        if not short.any():
+            break
+        high[short] *= 2
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        short = li_ma_array(middle + b, b / a, a) < s
+        low = np.where(short, middle, low)
+        high = np.where(short, high, middle)
+    excess[valid] = high
+    return excess
+
+def get_excess_from_sigma_and_bkg(sigma, bkg, alpha=0.2):
+    return float(excess_from_sigma_and_bkg_array(sigma, bkg, alpha))
+
+def get_prefactor(flux, erange, gamma=-2.4, e0=1, unit='TeV'):
+    '''Prefactor in [ph/cm2/s/MeV] at the pivot e0 of a power law with integral photon flux (in [ph/cm2/s]) within erange, broadcasting over arrays. Energies and pivot are given in unit.'''
+    conv = {'eV': 1e-6, 'keV': 1e-3, 'MeV': 1, 'GeV': 1e3, 'TeV': 1e6}[unit]
+    e1, e2 = np.asarray(erange[0], dtype=float) * conv, np.asarray(erange[1], dtype=float) * conv
+    e0 = e0 * conv
+    if gamma == -1:
+        integral = e0 * np.log(e2 / e1)
+    else:
+        integral = e0**(-gamma) * (e2**(gamma + 1) - e1**(gamma + 1)) / (gamma + 1)
+    return np.asarray(flux, dtype=float) / integral
+
 def read_timeslices_tsv(filename):
     ts = []
     with open(filename, mode='r', newline='\n') as fh:
@@ -106,10 +159,9 @@ def get_skycoord(pnt_coord):
     return coord
 
 def counting(phm, src, rad, off_regions, e_min=None, e_max=None, t_min=None, t_max=None, draconian=False):
-    on_count = phm.region_counter(src, rad, emin=e_min, emax=e_max, tmin=t_min, tmax=t_max)
-    off_count = 0
-    for r in off_regions:
-        off_count += phm.region_counter(r, r['rad'], emin=e_min, emax=e_max, tmin=t_min, tmax=t_max)
+    counts = phm.count_regions(on_and_off_regions(src, rad, off_regions), emin=e_min, emax=e_max, tmin=t_min, tmax=t_max)
+    on_count = counts[0]
+    off_count = counts[1:].sum()
 
     alpha = 1 / len(off_regions)
     excess = on_count - alpha * off_count
@@ -128,13 +180,7 @@ def find_off_regions(phm, algo, src, pnt, rad, verbose=False, save=None):
     if not len(pnt) == 2 and len(src) == 2:
         raise Exception('need source and pointing coordinates and a region radius to do aperture photometry')
 
-    off_regions = None
-    if algo.lower() == 'cross':
-        off_regions = phm.cross_regions(pnt, src, rad)
-    elif algo.lower() == 'reflection':
-        off_regions = phm.reflected_regions(pnt, src, rad)
-    else:
-        raise Exception('invalid background regions algorithm')
+    off_regions = cached_off_regions(algo, pnt, src, rad)
 
     if verbose > 1:
         print('off regions algorithm:', algo)
@@ -150,10 +196,8 @@ def aeff_eval(args, src, pnt):
     if not(args.energy_min and args.energy_max and args.pixel_size and args.power_law_index):
         raise Exception('need energy min and max, a pixel size to eval the flux')
 
-    aeff = EffectiveArea(irf_filename=args.irf_file)
-    # these IRFs return value in m², so we need convert
-    # the source data struct need a 'rad'
-    source_reg_aeff = aeff.weighted_value_for_region(src, pnt, [args.energy_min, args.energy_max], args.pixel_size, args.power_law_index) * 1e4 # cm2
+    # memoized region response in cm2
+    source_reg_aeff = aph_irf.region_response(args.irf_file, src, pnt, [args.energy_min, args.energy_max], args.pixel_size, args.power_law_index)
     return source_reg_aeff
 
 def get_offset(pointing, target):
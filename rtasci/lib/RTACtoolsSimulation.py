@@ -9,14 +9,18 @@
 
 import gammalib
 import ctools
+from cscripts import obsutils
 import os.path
 import csv
 import re
+import tempfile
+from contextlib import nullcontext
 import numpy as np
 import pandas as pd
 from astropy.io import fits
-from astropy.table import Table, vstack
 from scipy.interpolate import interp1d
+from scipy.integrate import trapezoid
+from rtasci.aph.asimov import template_time_edges
 
 # create observation list with gammalib ---!
 def make_obslist(obslist, items, names, instruments='CTA'):
@@ -36,12 +40,86 @@ def make_obslist(obslist, items, names, instruments='CTA'):
     del xml
     return 
 
+# events within GTI ---!
+def gti_mask(times, GTI):
+    '''Boolean mask of the events with TIME within the GTI, edges included.'''
+    times = np.asarray(times)
+    return (times >= GTI[0]) & (times <= GTI[1])
+
+# events within GTI of time sorted events ---!
+def gti_slice(times, GTI):
+    '''Slice of the time sorted events with TIME within the GTI, edges included.'''
+    times = np.asarray(times)
+    return slice(int(np.searchsorted(times, GTI[0], side='left')), int(np.searchsorted(times, GTI[1], side='right')))
+
+# event times closest to GTI edges ---!
+def nearest_gti(times, GTI):
+    '''Times of the time sorted events closest to each GTI edge, the earliest on ties.'''
+    times = np.asarray(times)
+    if len(times) == 0:
+        raise ValueError('No events to set the GTI.')
+    edges = np.searchsorted(times, GTI, side='left')
+    lower, upper = np.clip(edges - 1, 0, len(times) - 1), np.clip(edges, 0, len(times) - 1)
+    nearest = np.where(np.abs(times[lower] - GTI) <= np.abs(times[upper] - GTI), lower, upper)
+    return [times[nearest[0]], times[nearest[1]]]
+
+# reindex rows after sorting ---!
+def reindex_events(events, column=0):
+    '''Sets the events ID column (the first one by default) to 1, 2, ..., in place.'''
+    events.field(column)[:] = np.arange(1, len(events) + 1)
+    return events
+
+# in-memory photon list of a simulated observation ---!
+def observation_hdulist(obs):
+    '''Converts an in-memory observation (e.g. the output of ctobssim in on RAM mode) into the HDUList of the equivalent ctobssim output file. The observation is written with its attributes (LIVETIME, ONTIME, TSTART, ...) to a temporary file in shared memory when available, which is read back in bulk and removed.'''
+    if isinstance(obs, fits.HDUList):
+        return obs
+    gfits = gammalib.GFits()
+    obs.write(gfits)
+    tmpdir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    fd, filename = tempfile.mkstemp(suffix='.fits', dir=tmpdir)
+    os.close(fd)
+    try:
+        gfits.saveto(filename, True)
+        gfits.close()
+        # copy all data in memory before the file is closed and removed ---!
+        with fits.open(filename, memmap=False) as f:
+            hdul = fits.HDUList([hdu.copy() for hdu in f])
+    finally:
+        os.remove(filename)
+    return hdul
+
+# merge template time bins within tolerance ---!
+def coarsen_time_bins(rates, durations, tolerance):
+    '''Groups consecutive time bins while the counts of every bin of a group, predicted with the duration weighted mean rate of the group, stay within the relative tolerance from its own counts. Returns the groups as (first, stop) bin ranges and the expected bias of the merged bins counts, per bin and cumulative over time.'''
+    rates, durations = np.asarray(rates, dtype=float), np.asarray(durations, dtype=float)
+    def bias(first, stop):
+        mean = np.sum(rates[first:stop] * durations[first:stop]) / np.sum(durations[first:stop])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(rates[first:stop] > 0, np.abs(mean / rates[first:stop] - 1), np.where(mean > 0, np.inf, 0.0)), mean
+    groups, merged_rates = [], np.empty(len(rates))
+    first = 0
+    while first < len(rates):
+        stop = first + 1
+        while stop < len(rates) and bias(first, stop + 1)[0].max() <= tolerance:
+            stop += 1
+        groups.append((first, stop))
+        merged_rates[first:stop] = bias(first, stop)[1]
+        first = stop
+    counts, merged_counts = rates * durations, merged_rates * durations
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bin_bias = np.where(counts > 0, np.abs(merged_counts / counts - 1), 0.0)
+        cumulative_bias = np.where(np.cumsum(counts) > 0, np.abs(np.cumsum(merged_counts) / np.cumsum(counts) - 1), 0.0)
+    report = {'bins': len(rates), 'merged_bins': len(groups), 'max_bin_bias': float(bin_bias.max(initial=0)), 'max_cumulative_bias': float(cumulative_bias.max(initial=0))}
+    return groups, report
+
 class RTACtoolsSimulation():
     '''
     This class allows to: 1) compute the EBL absorption from a csv data table and add it to the template; 2) extract spectra, lightcuves and time slices from the template (the flux values can also be normalised by a factor); 3) merge bins of the template simulation in a single photon list; 4) perform simulations using ctoobssim from ctools software package.
     '''
-    def __init__(self):
+    def __init__(self, on_ram=False):
         # files fields ---!
+        self.__on_ram = on_ram
         self.model, self.template, self.table = (str() for i in range(3))
         self.output, self.input = (str() for i in range(2))
         self.caldb = 'prod2'  # caldb (str) ---!
@@ -52,6 +130,8 @@ class RTACtoolsSimulation():
         self.plot = False  # option for retrieving plotting values ---!
         self.zfetch = False  # set/unset automatic fetching of redshift ---!
         self.set_debug = False  # set/unset debug mode for ctools ---!
+        self.coarsen_tolerance = None  # merge template time bins within this relative counts tolerance ---!
+        self.coarsening_report = None  # expected counts bias of the merged time bins ---!
         self.set_log = True  # set/unset logfiles for ctools ---!
         # data ---!
         self.e = [0.03, 150.0]  # energy range (TeV) ---!
@@ -237,21 +317,27 @@ class RTACtoolsSimulation():
         with open(table, 'w+') as tab:
             tab.write('#bin,tmax_bin')
         # spectra and models ---!
-        for i in range(self.__Nt):
+        spectra = self.__ebl if self.set_ebl else self.__spectra
+        groups = [(i, i + 1) for i in range(self.__Nt)]
+        if self.coarsen_tolerance is not None:
+            groups = self.coarsenTemplate(self.coarsen_tolerance)
+        for i, (first, stop) in enumerate(groups):
             filename = os.path.join(data_path, f'spec_tbin{i:02d}.out')
             if os.path.isfile(filename):
                 os.remove(filename)
             # time slices table ---!
             with open(table, 'a') as tab:
-                tab.write('\n' + str(i) + ', ' + str(self.__time[i][0]))
+                tab.write('\n' + str(i) + ', ' + str(self.__time[stop - 1][0]))
+            # merged bins take the duration weighted mean spectrum ---!
+            if stop - first == 1:
+                spectrum = spectra[first]
+            else:
+                spectrum = np.average(np.array(spectra[first:stop].tolist(), dtype=float), axis=0, weights=self.__templateDurations()[first:stop])
             # spectra ---!
             with open(filename, 'a+') as f:
                 for j in range(self.__Ne):
                     # write spectral data in E [MeV] and I [ph/cm2/s/MeV] ---!
-                    if self.set_ebl:
-                        f.write(str(self.__energy[j][0] * 1000.0) + ' ' + str(self.__ebl[i][j] / 1000.0 / scalefluxfactor) + "\n")
-                    else:
-                        f.write(str(self.__energy[j][0] * 1000.0) + ' ' + str(self.__spectra[i][j] / 1000.0 / scalefluxfactor) + "\n")
+                    f.write(str(self.__energy[j][0] * 1000.0) + ' ' + str(spectrum[j] / 1000.0 / scalefluxfactor) + "\n")
             # xml models ---!
             os.system('cp ' + str(self.model) + ' ' + str(os.path.join(data_path, f'{source_name}_tbin{i:02d}.xml')))
             s = open(os.path.join(data_path, f'{source_name}_tbin{i:02d}.xml')).read()
@@ -260,6 +346,24 @@ class RTACtoolsSimulation():
                 f.write(s)
         return
 
+    # durations of the template time bins ---!
+    def __templateDurations(self):
+        '''Gets the duration of each template time bin, on the same edges as the Asimov counts.'''
+        return np.diff(template_time_edges([t[0] for t in self.__time]))
+
+    # merge template time bins within tolerance ---!
+    def coarsenTemplate(self, tolerance):
+        '''Groups consecutive template time bins whose counts, integrated over the energy range, differ by less than the relative tolerance from those of their merged spectrum. Returns the bins groups and stores the expected bias in coarsening_report.'''
+        self.__getFitsData()
+        energies = np.array([e[0] for e in self.__energy], dtype=float)  # GeV ---!
+        spectra = np.array((self.__ebl if self.set_ebl else self.__spectra).tolist(), dtype=float)
+        inside = (energies >= self.e[0] * 1e3) & (energies <= self.e[1] * 1e3)
+        if np.count_nonzero(inside) < 2:
+            inside[:] = True
+        rates = trapezoid(spectra[:, inside], energies[inside], axis=1)
+        groups, self.coarsening_report = coarsen_time_bins(rates, self.__templateDurations(), tolerance)
+        return groups
+
     # read template and return tbin_stop containing necessary exposure time coverage ---!
     def loadTemplate(self, source_name, return_bin=False, data_path=None, scalefluxfactor=1):
         '''Loads template data (spectra, lightcurves and time slices).'''
@@ -339,13 +443,14 @@ class RTACtoolsSimulation():
 
     # ctobssim wrapper ---!
     def run_simulation(self, inobs=None, prefix=None, startindex=None):
-        '''Wrapper for ctobssim simulation.'''
+        '''Wrapper for ctobssim simulation. In on RAM mode no file is written and the simulated observations are returned.'''
         self.input = inobs
         sim = ctools.ctobssim()
         if self.input != None: 
             sim["inobs"] = self.input 
         sim["inmodel"] = self.model
-        sim["outevents"] = self.output
+        if not self.__on_ram:
+            sim["outevents"] = self.output
         sim["caldb"] = self.caldb
         sim["irf"] = self.irf
         if self.edisp:
@@ -363,11 +468,57 @@ class RTACtoolsSimulation():
         sim["emax"] = self.e[1]
         sim["seed"] = self.seed
         sim["nthreads"] = self.nthreads
-        sim["logfile"] = self.output.replace('.fits', '.log')
         sim["debug"] = self.set_debug
-        if self.set_log:
+        if self.set_log and self.output:
+            sim["logfile"] = self.output.replace('.fits', '.log')
             sim.logFileOpen()
-        sim.execute()
+        if not self.__on_ram:
+            sim.execute()
+            return
+        sim.run()
+        return sim.obs().copy()
+
+    # single ctobssim call over all time bins ---!
+    def run_timevariable_simulation(self, models, times, GTI=None, new_GTI=False):
+        '''Simulates all the time bins ([tmin, tmax] of each model) of a template with a single ctobssim call. Each bin is an observation of one container with the bin GTI, and the source models of each bin are bound to their observation through the model ids, so the spectral evolution of the template is kept. Background models are taken from the first bin and shared by all observations. The events are merged in the output photon list, or the simulated observations are returned in on RAM mode.'''
+        if len(models) != len(times):
+            raise ValueError('Need one model for each time bin.')
+        if not self.__on_ram and not self.output:
+            raise ValueError('Need an output photon list, or on RAM mode.')
+        pntdir = gammalib.GSkyDir()
+        pntdir.radec_deg(self.pointing[0], self.pointing[1])
+        obs = gammalib.GObservations()
+        container = gammalib.GModels()
+        for j, model in enumerate(models):
+            obsid = f'{j:06d}'
+            obs.append(obsutils.set_obs(pntdir, tstart=times[j][0], duration=times[j][1]-times[j][0], emin=self.e[0], emax=self.e[1], rad=self.fov, irf=self.irf, caldb=self.caldb, obsid=obsid))
+            bin_models = gammalib.GModels(model)
+            for m in bin_models:
+                # background models are CTA specific ---!
+                if m.classname().startswith('GCTA'):
+                    if j == 0:
+                        container.append(m)
+                    continue
+                m.name(f'{m.name()}_tbin{j:02d}')
+                m.ids(obsid)
+                container.append(m)
+        obs.models(container)
+        sim = ctools.ctobssim(obs)
+        if self.edisp:
+            sim["edisp"] = self.edisp
+        sim["seed"] = self.seed
+        sim["nthreads"] = self.nthreads
+        sim["debug"] = self.set_debug
+        if self.set_log and self.output:
+            sim["logfile"] = self.output.replace('.fits', '.log')
+            sim.logFileOpen()
+        sim.run()
+        if self.__on_ram:
+            return sim.obs().copy()
+        observations = [sim.obs()[i] for i in range(sim.obs().size())]
+        if GTI == None:
+            GTI = [times[0][0], times[-1][1]]
+        self.__singlePhotonList(sample=observations, filename=self.output, GTI=GTI, new_GTI=new_GTI)
         return
 
     # dopr duplicates in list ---!
@@ -379,45 +530,6 @@ class RTACtoolsSimulation():
                 new_list.append(l)
         return new_list
 
-    # keep only events within given GTI ---!
-    def __dropExceedingEvents(self, hdul, GTI):
-        '''Drops events exceeding GTI.'''
-        slice_list = []
-        times = hdul[1].data.field('TIME')
-        for i, t in enumerate(times):
-            if t >= GTI[0] and t <= GTI[1]:
-                slice_list.append(i)
-        return slice_list
-
-    # change from GTI of run to min and max of time events ---!
-    def __newGoodTimeIntervals(self, hdul, GTI):
-        '''Replaces GTI with min and max time of events.'''
-        GTI_new = []
-        GTI_new.append(min(hdul[1].data.field('TIME'), key=lambda x: abs(x - GTI[0])))
-        GTI_new.append(min(hdul[1].data.field('TIME'), key=lambda x: abs(x - GTI[1])))
-        hdul[2].data[0][0] = GTI_new[0]
-        hdul[2].data[0][1] = GTI_new[1]
-        hdul.flush()
-        return
-
-    # reindex rows after sorting ---!
-    def __reindexEvents(self, hdul):
-        '''Reindexes events.'''
-        indexes = hdul[1].data.field(0)
-        for i, ind in enumerate(indexes):
-            hdul[1].data.field(0)[i] = i + 1
-        hdul.flush()
-        return
-
-    # sort simulated events by time (TIME) instead of source (MC_ID) ---!
-    def __sortEventsByTime(self, hdul, hdr):
-        '''Sorts events by time.'''
-        data = Table(hdul[1].data)
-        data.sort('TIME')
-        hdul[1] = fits.BinTableHDU(name='EVENTS', data=data, header=hdr)
-        hdul.flush()
-        return
-
     # check GTI and raise error if bad values are passed ---!
     def __checkGTI(self, hdul):
         '''Checks that all events fall within the GTI.'''
@@ -429,73 +541,80 @@ class RTACtoolsSimulation():
 
     # create single photon list from obs list ---!
     def __singlePhotonList(self, sample, filename, GTI, new_GTI=True):
-        '''Merge segmented simulations into a single photon list, updating all required header keywords.'''
-        sample = sorted(sample)
+        '''Merge segmented simulations into a single photon list, updating all required header keywords. The headers are read first to preallocate the merged table, which is then filled bin by bin.'''
+        if all(isinstance(f, str) for f in sample):
+            sample = sorted(sample)
+            # size the merged table from the headers ---!
+            nrows = [fits.getheader(f, 1)['NAXIS2'] for f in sample]
+        else:
+            # in-memory observations are merged in the given order ---!
+            sample = [f if isinstance(f, str) else observation_hdulist(f) for f in sample]
+            nrows = [fits.getheader(f, 1)['NAXIS2'] if isinstance(f, str) else len(f[1].data) for f in sample]
+        if sum(nrows) == 0:
+            raise ValueError('No events to merge in photon list append.')
         n = 0
-        for i, f in enumerate(sample):
-            with fits.open(f) as hdul:
-                if len(hdul[1].data) == 0:
-                    continue
+        for f, rows in zip(sample, nrows):
+            if rows == 0:
+                continue
+            with (fits.open(f) if isinstance(f, str) else nullcontext(f)) as hdul:
                 if n == 0:
-                    # load header and table ---!
-                    hdr1 = hdul[1].header
-                    hdr2 = hdul[2].header
-                    ext1 = Table(hdul[1].data)
-                    ext2 = hdul[2].data
-                    n += 1
+                    # load header and preallocate table ---!
+                    hdr1 = hdul[1].header.copy()
+                    hdr2 = hdul[2].header.copy()
+                    ext2 = hdul[2].data.copy()
+                    events = fits.BinTableHDU.from_columns(hdul[1].columns, nrows=sum(nrows)).data
                 else:
-                    # update header and append table ---!
+                    # update header ---!
                     hdr1['LIVETIME'] += hdul[1].header['LIVETIME']
                     hdr1['ONTIME'] += hdul[1].header['ONTIME']
                     hdr1['TELAPSE'] += hdul[1].header['TELAPSE']
                     hdr1['TSTOP'] = hdul[1].header['TSTOP']
                     hdr1['DATE-END'] = hdul[1].header['DATE-END']
                     hdr1['TIME-END'] = hdul[1].header['TIME-END']
-                    ext1 = vstack([ext1, Table(hdul[1].data)])
-                hdul.close()
-        # create output FITS file empty ---!
-        hdu = fits.PrimaryHDU()
-        hdul = fits.HDUList([hdu])
-        hdul.writeto(filename, overwrite=True) if os.path.isfile(filename) else hdul.writeto(filename)
-        hdul.close()
-        # update FITS file ---!
-        with fits.open(filename, mode='update') as hdul:
-            hdu1 = fits.BinTableHDU(name='EVENTS', data=ext1, header=hdr1)
-            hdu2 = fits.BinTableHDU(name='GTI', data=ext2, header=hdr2)
-            hdul.append(hdu1)
-            hdul.append(hdu2)
-            hdul.flush()
-            # sort table by time ---!
-            self.__sortEventsByTime(hdul=hdul, hdr=hdr1)
-        # manipulate fits ---!
-        with fits.open(filename, mode='update') as hdul:
-            # drop events exceeding GTI ---!
-            slice = self.__dropExceedingEvents(hdul=hdul, GTI=GTI)
-            if len(slice) > 0:
-                hdul[1].data = hdul[1].data[slice]
-            hdul.flush()
-            # modify indexes  ---!
-            self.__reindexEvents(hdul=hdul)
-            # modify GTI ---!
-            if new_GTI:
-                self.__newGoodTimeIntervals(hdul=hdul, GTI=GTI)
-            else:
-                hdul[2].data[0][0] = GTI[0]
-                hdul[2].data[0][1] = GTI[1]
-            hdul.flush()
+                # fill table ---!
+                for name in events.names:
+                    events[name][n:n+rows] = hdul[1].data[name]
+                n += rows
+        return self.__writePhotonList(events=events, hdr1=hdr1, ext2=ext2, hdr2=hdr2, filename=filename, GTI=GTI, new_GTI=new_GTI)
+
+    # sort, cut and write merged photon list ---!
+    def __writePhotonList(self, events, hdr1, ext2, hdr2, filename, GTI, new_GTI=True):
+        '''Sorts the merged events by time, drops events exceeding GTI, reindexes them and writes the photon list in a single write. Without a filename the photon list is returned instead.'''
+        # sort table by time ---!
+        events = events[np.argsort(events['TIME'], kind='stable')]
+        # drop events exceeding GTI ---!
+        within = gti_slice(events['TIME'], GTI)
+        if within.stop > within.start:
+            events = events[within]
+        # modify indexes ---!
+        reindex_events(events)
+        # modify GTI ---!
+        if new_GTI:
+            GTI = nearest_gti(events['TIME'], GTI)
+        ext2[0][0] = GTI[0]
+        ext2[0][1] = GTI[1]
+        hdu1 = fits.BinTableHDU(name='EVENTS', data=events, header=hdr1)
+        hdu2 = fits.BinTableHDU(name='GTI', data=ext2, header=hdr2)
+        hdul = fits.HDUList([fits.PrimaryHDU(), hdu1, hdu2])
+        if not filename:
+            return hdul
+        hdul.writeto(filename, overwrite=True)
         return
 
     # created one FITS table containing all events and GTIs ---!
     def appendEventsSinglePhList(self, GTI=None, new_GTI=False):
-        '''From a list of simulations generates a single photon list.'''
+        '''From a list of simulations (files or in-memory observations) generates a single photon list. Without an output file the photon list is returned as HDUList.'''
+        sample = []
+        for f in self.input:
+            if isinstance(f, gammalib.GObservations):
+                sample += [observation_hdulist(f[i]) for i in range(f.size())]
+            else:
+                sample.append(f if isinstance(f, str) else observation_hdulist(f))
         if GTI == None:
             GTI = []
-            with fits.open(self.input[0]) as hdul:
-                GTI.append(hdul[2].data[0][0])
-            with fits.open(self.input[-1]) as hdul:
-                GTI.append(hdul[2].data[0][1])
-        self.__singlePhotonList(sample=self.input, filename=self.output, GTI=GTI, new_GTI=new_GTI)
-        return
+            GTI.append(fits.getdata(sample[0], 2)[0][0] if isinstance(sample[0], str) else sample[0][2].data[0][0])
+            GTI.append(fits.getdata(sample[-1], 2)[0][1] if isinstance(sample[-1], str) else sample[-1][2].data[0][1])
+        return self.__singlePhotonList(sample=sample, filename=self.output, GTI=GTI, new_GTI=new_GTI)
 
     # shift times in template simulation to append background before burst ---!
     def shiftTemplateTime(self, phlist, time_shift):
@@ -562,14 +681,8 @@ class RTACtoolsSimulation():
     def sortObsEvents(self, key='TIME'):
         '''Sorts simulated events by keyword.'''
         with fits.open(self.input, mode='update') as hdul:
-            data = Table(hdul[1].data)
-            data.sort(key)
-            hdr = hdul[1].header
-            hdul[1] = fits.BinTableHDU(name='EVENTS', data=data, header=hdr)
+            data = hdul[1].data[np.argsort(hdul[1].data[key], kind='stable')]
+            reindex_events(data)
+            hdul[1] = fits.BinTableHDU(name='EVENTS', data=data, header=hdul[1].header)
             hdul.flush()
-            hdul.close()
-        with fits.open(self.input, mode='update') as hdul:
-            self.__reindexEvents(hdul=hdul)
-            hdul.flush()
-            hdul.close()
-        return
\ No newline at end of file
+        return
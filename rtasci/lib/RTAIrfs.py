@@ -13,6 +13,7 @@ import numpy as np
 from os.path import join
 from astropy.io import fits
 from scipy.interpolate import interp1d
+from rtasci.aph.irf import get_irf, nearest_bin_index
 
 class RTAIrfs:
     '''
@@ -107,14 +108,15 @@ class RTAIrfs:
         inv = 1 / self.factor
         extension = 'EFFECTIVE AREA'
         field = 4
-        with fits.open(nominal_irf) as hdul:
-            elo = np.array(hdul[extension].data.field(0)[:].astype(float)[0])
-            ehi = np.array(hdul[extension].data.field(1)[:].astype(float)[0])
-            e = elo + 0.5*(ehi - elo)
-            tlo = np.array(hdul[extension].data.field(2)[:].astype(float)[0])
-            thi = np.array(hdul[extension].data.field(3)[:].astype(float)[0])
-            theta = tlo + 0.5*(thi - tlo)
-            aeff = np.array(hdul[extension].data.field(field)[:].astype(float)[0])
+        # nominal irf columns in FITS order ---!
+        columns = list(get_irf(nominal_irf).table(extension).values())
+        elo = columns[0].astype(float)
+        ehi = columns[1].astype(float)
+        e = elo + 0.5*(ehi - elo)
+        tlo = columns[2].astype(float)
+        thi = columns[3].astype(float)
+        theta = tlo + 0.5*(thi - tlo)
+        aeff = columns[field].astype(float)
         # effective area multiplied by inv of factor ---!
         a = np.where(np.array([i * inv for i in aeff]) is np.nan, 0., np.array([i * inv for i in aeff]))
         # degrade and save new ---!
@@ -141,45 +143,29 @@ class RTAIrfs:
         # initialise ---!
         extension = 'BACKGROUND'
         field = 6
-        with fits.open(nominal_irf) as hdul:
-            xlo = np.array(hdul[extension].data.field(0)[:].astype(float)[0])
-            xhi = np.array(hdul[extension].data.field(1)[:].astype(float)[0])
-            x = xlo + 0.5*(xhi - xlo)
-            ylo = np.array(hdul[extension].data.field(2)[:].astype(float)[0])
-            yhi = np.array(hdul[extension].data.field(3)[:].astype(float)[0])
-            y = ylo + 0.5*(yhi - ylo)
-            elo = np.array(hdul[extension].data.field(4)[:].astype(float)[0])
-            ehi = np.array(hdul[extension].data.field(5)[:].astype(float)[0])
-            e_bkg = elo + 0.5*(ehi - elo)
-            bkg = np.array(hdul[extension].data.field(field)[:].astype(float)[0])
-        # spatial pixel/deg conversion factor ---!
-        conv_factor = (xhi.max() - xlo.min()) / theta.max()
-        # interpolated Aeff via energy grid ---!
-        nominal_interp, degraded_interp = ([[]*i for i in range(len(theta))] for i in range(2))
-        for i in range(len(theta)):
-            fnom = interp1d(e_aeff[:], aeff_nom[i,:])
-            nominal_interp[i].append(fnom(e_bkg[:]))
-            fdeg = interp1d(e_aeff[:], aeff_deg[i,:])
-            degraded_interp[i].append(fdeg(e_bkg[:]))
-        # flatten list of theta interpolations (theta array of energy frames) ---!
-        nominal_interp = np.array([item for sublist in nominal_interp for item in sublist])
-        degraded_interp = np.array([item for sublist in degraded_interp for item in sublist])
-        # empty copy of bkg tensor ---!
-        b = np.empty_like(bkg)
-        for idf, frame in enumerate(bkg[:,0,0]):
-            for idx, xpix in enumerate(bkg[idf,:,0]):
-                for idy, ypix in enumerate(bkg[idf,idx,:]):
-                    # find radius in degrees ---!
-                    r = np.sqrt((0 - xpix)**2 + (0 - ypix)**2)
-                    rdegree = r * conv_factor
-                    # find corresponding theta index ---!
-                    angle = min(theta, key=lambda x:abs(x-rdegree))
-                    idtheta = np.where(np.isin(theta[:], angle))
-                    # degrade the background count for frame/x/y point ---!
-                    if nominal_interp[idtheta,idf] == 0.:
-                        b[idf, idx, idy] = 0.
-                    else:
-                        b[idf,idx,idy] = bkg[idf,idx,idy] / nominal_interp[idtheta,idf] * degraded_interp[idtheta,idf]
+        # nominal irf columns in FITS order ---!
+        columns = list(get_irf(nominal_irf).table(extension).values())
+        xlo = columns[0].astype(float)
+        xhi = columns[1].astype(float)
+        x = xlo + 0.5*(xhi - xlo)
+        ylo = columns[2].astype(float)
+        yhi = columns[3].astype(float)
+        y = ylo + 0.5*(yhi - ylo)
+        elo = columns[4].astype(float)
+        ehi = columns[5].astype(float)
+        e_bkg = elo + 0.5*(ehi - elo)
+        bkg = columns[field].astype(float)
+        # interpolated Aeff via energy grid (theta, energy frame) ---!
+        nominal_interp = interp1d(e_aeff, aeff_nom, axis=1)(e_bkg)
+        degraded_interp = interp1d(e_aeff, aeff_deg, axis=1)(e_bkg)
+        # nearest theta of each spatial pixel from its offset in degrees (bkg axes are energy, y, x) ---!
+        rdegree = np.hypot(y[:, np.newaxis], x[np.newaxis, :])
+        idtheta = nearest_bin_index(theta, rdegree)
+        # degrade the background count for frame/x/y point ---!
+        nominal = nominal_interp[idtheta, :].transpose(2, 0, 1)
+        degraded = degraded_interp[idtheta, :].transpose(2, 0, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            b = np.where(nominal == 0., 0., bkg / nominal * degraded)
         # save to new ---!
         with fits.open(degraded_irf, mode='update') as hdul:
             hdul[extension].data.field(field)[:] = b
@@ -12,7 +12,8 @@ import numpy as np
 from astropy.io import fits
 from os.path import join
 from scipy import stats
-from scipy.interpolate import interp2d
+from scipy.interpolate import RegularGridInterpolator
+from rtasci.aph.irf import get_irf
 
 # center of fov from FITS ---!
 def get_pointing(fits_file):
@@ -166,32 +167,27 @@ def compute_prefactor(flux, erange, gamma=-2.4, e0=1e6, unit='MeV'):
 
 def compute_phcount(texp, irf, k0, offset=1.638, eTeV=[0.03, 150.0], nbin=1000):
     '''Compute the photon count from the prefactor, for given irf, off-axs angle, and energy range.'''
-    with fits.open(irf) as h:
-        aeff = h['EFFECTIVE AREA'].data
+    aeff = get_irf(irf).aeff
 
-    elow = aeff['ENERG_LO'][0] # TeV
-    ehigh = aeff['ENERG_HI'][0] # TeV
-    thetalo = aeff['THETA_LO'][0] # deg
-    thetahi = aeff['THETA_HI'][0] # deg
-    area = aeff['EFFAREA'][0] # m2
+    elow = aeff['ENERG_LO'] # TeV
+    ehigh = aeff['ENERG_HI'] # TeV
+    thetalo = aeff['THETA_LO'] # deg
+    thetahi = aeff['THETA_HI'] # deg
+    area = aeff['EFFAREA'] # m2
     # energy in TeV
     x = (elow+ehigh)/2
     y = (thetalo+thetahi)/2
     z = area
-    # interpolate
-    f = interp2d(x, y, z, kind='linear')
+    # bilinear interpolation, holding the edge values outside the grid
+    grid = RegularGridInterpolator((y, x), z, method='linear')
+    f = lambda e, t: grid((np.clip(t, y[0], y[-1]), np.clip(e, x[0], x[-1])))
     yref = offset
     eref = np.logspace(np.log10(eTeV[0]), np.log10(eTeV[1]), nbin)
-    s = 0
-    for i in range(len(eref)-1):
-        # aeff at energy bin edges; convert m2 -> cm2
-        a1 = f(eref[i], yref) * 10**4 # cm2
-        a2 = f(eref[i+1], yref) * 10**4 # cm2
-        # delta ph = prefactor * exposure * mean aeff * delta energy (convert TeV -> MeV)
-        ph = k0 * texp * (a1+a2)/2 * (eref[i+1]-eref[i])*1e6 # dph = ph/cm2/s/MeV * s * <cm2> * dMeV
-        # sum photons in bins
-        s += float(ph) # sum dph
-    return s
+    # aeff at energy bin edges; convert m2 -> cm2
+    a = f(eref, yref) * 10**4 # cm2
+    # delta ph = prefactor * exposure * mean aeff * delta energy (convert TeV -> MeV), summed over the bins
+    s = k0 * texp * np.sum((a[1:]+a[:-1])/2 * np.diff(eref)*1e6) # dph = ph/cm2/s/MeV * s * <cm2> * dMeV
+    return float(s)
 
 def phm_options(erange, texp, time_int, target, pointing, irf_file, index=-2.4, bkg_method="reflection", radius=0.2, pixsize=0.05, verbose=0, save_off_reg='.'):
     opts = {}
@@ -17,6 +17,7 @@ from rtasci.lib.RTAUtils import *
 from rtasci.lib.RTAUtilsGW import *
 from rtasci.cfg.Config import Config
 from rtasci.aph.utils import *
+from rtasci.aph.irf import get_irf
 
 parser = argparse.ArgumentParser(description='ADD SCRIPT DESCRIPTION HERE')
 parser.add_argument('-f', '--cfgfile', type=str, required=True, help="Path to the yaml configuration file")
@@ -115,7 +116,7 @@ for runid in runids:
             print(f'Calibration database: {caldb}')       
         # ------------------------------------------------------ loop irf ---!!!
         for irf in irfs:
-            girf = load_cta_irfs(f"{expandvars('$CTOOLS')}/share/caldb/data/cta/{caldb}/bcf/{irf}/irf_file.fits")
+            girf = get_irf(f"{expandvars('$CTOOLS')}/share/caldb/data/cta/{caldb}/bcf/{irf}/irf_file.fits").gammapy()
             if args.print.lower() == 'true':
                 print(f'Instrument response function: {irf}')  
             erange = check_energy_thresholds(erange=[cfg.get('emin'), cfg.get('emax')], irf=irf)
@@ -19,6 +19,7 @@ from rtasci.lib.RTAUtils import *
 from rtasci.lib.RTAUtilsGW import *
 from rtasci.cfg.Config import Config
 from rtasci.aph.utils import *
+from rtasci.aph.cache import RegionResponseCache, RESPONSE_CACHE_ENV, set_response_cache
 from astropy.coordinates import SkyCoord
 from astropy.coordinates import SkyCoord
 from regions import CircleSkyRegion
@@ -82,6 +83,8 @@ if not isdir(f"{datapath}/rta_products"):
     os.mkdir(f"{datapath}/rta_products")
 if not isdir(f"{datapath}/skymaps"):
     os.mkdir(f"{datapath}/skymaps")
+# region responses shared by all trials and workers ---!
+set_response_cache(RegionResponseCache(path=os.environ.get(RESPONSE_CACHE_ENV, f"{datapath}/rta_products/region_responses.sqlite")))
 
 # ------------------------------------------------------ loop runid --- !!!
 for runid in runids:
@@ -205,9 +208,7 @@ for runid in runids:
                             run_list = filenames.getRunList()
                             filenames.closeXml()
                             del filenames
-                            selphlist = Photometrics.load_data_from_fits_file(run_list[0])
-                            for file in run_list[1:]:
-                                selphlist = np.append(selphlist, Photometrics.load_data_from_fits_file(file))
+                            selphlist = Photometrics.load_data_from_fits_files(run_list)
 
                         # on/off ---!
                         if '.fits' in selphlist:
@@ -220,9 +221,7 @@ for runid in runids:
                             run_list = filenames.getRunList()
                             filenames.closeXml()
                             del filenames
-                            selphlist = Photometrics.load_data_from_fits_file(run_list[0])
-                            for file in run_list[1:]:
-                                selphlist = np.append(selphlist, Photometrics.load_data_from_fits_file(file))
+                            selphlist = Photometrics.load_data_from_fits_files(run_list)
                         
  
                         # load the event list
@@ -300,9 +299,7 @@ for runid in runids:
                                 run_list = filenames.getRunList()
                                 filenames.closeXml()
                                 del filenames
-                                selphlist = Photometrics.load_data_from_fits_file(run_list[0])
-                                for file in run_list[1:]:
-                                    selphlist = np.append(selphlist, Photometrics.load_data_from_fits_file(file))
+                                selphlist = Photometrics.load_data_from_fits_files(run_list)
 
                             # aperture photometry ---!
                             phm = Photometrics({events_type: selphlist})
@@ -10,15 +10,15 @@
 import os
 import sys
 import argparse
-import time
 import numpy as np
 from os.path import isdir, join, isfile, expandvars
-from rtasci.lib.RTACtoolsAnalysis import RTACtoolsAnalysis
 from rtasci.lib.RTAManageXml import ManageXml
 from rtasci.lib.RTAUtils import *
 from rtasci.lib.RTAUtilsGW import *
 from rtasci.cfg.Config import Config
 from rtasci.aph.utils import *
+from rtasci.aph.cumulative import CumulativeCounts
+from rtasci.aph.cache import RegionResponseCache, RESPONSE_CACHE_ENV, set_response_cache
 
 parser = argparse.ArgumentParser(description='ADD SCRIPT DESCRIPTION HERE')
 parser.add_argument('-f', '--cfgfile', type=str, required=True, help="Path to the yaml configuration file")
@@ -72,6 +72,8 @@ if not isdir(f"{datapath}/rta_products"):
     os.mkdir(f"{datapath}/rta_products")
 if not isdir(f"{datapath}/skymaps"):
     os.mkdir(f"{datapath}/skymaps")
+# region responses shared by all trials and workers ---!
+set_response_cache(RegionResponseCache(path=os.environ.get(RESPONSE_CACHE_ENV, f"{datapath}/rta_products/region_responses.sqlite")))
 
 # ------------------------------------------------------ loop runid --- !!!
 for runid in runids:
@@ -143,6 +145,20 @@ for runid in runids:
                     print(f'Missing observation {phlist}. \nSkip runid {runid}.')
                     break
 
+                # load the trial events once ---!
+                if args.merge.lower() == 'true':
+                    events_type = 'events_filename'
+                    events = phlist
+                else:
+                    events_type = 'events_list'
+                    filenames = ManageXml(phlist)
+                    run_list = filenames.getRunList()
+                    filenames.closeXml()
+                    del filenames
+                    events = Photometrics.load_data_from_fits_files(run_list)
+                phm = Photometrics({events_type: events})
+                pointing = tuple(pointing)
+
                 # --------------------------------------------------- loop exposure times ---!!!
                 for exp in cfg.get('exposure'):   
                     if cfg.get('cumulative'):
@@ -156,63 +172,45 @@ for runid in runids:
                     if len(times) == 0:
                         times = [times]
 
+                    # time selections ---!
+                    if cfg.get('lightcurve'):
+                        tstart = np.array(times, dtype=float)
+                        tstop = tstart + exp
+                    else: 
+                        tstart = np.full(len(times), float(cfg.get('delay')))
+                        tstop = tstart + np.array(times, dtype=float)
+
+                    # on/off of all time selections in a single pass ---!
+                    opts = phm_options(erange=erange, texp=exp, time_int=[tstart[0], tstop[-1]], target=target, pointing=pointing, index=cfg.get('index'), save_off_reg=f"{expandvars(cfg.get('data'))}/rta_products/{runid}/texp{exp}s_{name}_off_regions.reg", irf_file=join(expandvars('$CTOOLS'), f"share/caldb/data/cta/{caldb}/bcf/{irf}/irf_file.fits"))
+                    off_regions = find_off_regions(phm, opts['background_method'], target, pointing, opts['region_radius'], verbose=opts['verbose'], save=opts['save_off_regions'])
+                    onoff = CumulativeCounts(phm, target, opts['region_radius'], off_regions, emin=opts['energy_min'], emax=opts['energy_max'])
+                    photometry = onoff.photometry(tstart, tstop)
+                    if args.print.lower() == 'true' and cfg.get('cumulative'):
+                        print(f"Time to detection = {onoff.detection_times(start=cfg.get('delay'), thresholds=(3, 5))} s")
+
                     # ---------------------------------------------------------- loop binning ---!!!
-                    for t in times:
+                    for k, t in enumerate(times):
                         if t == len(times) and cfg.get('lightcurve'):
                             break
-                        # selection ---!
-                        selphlist = phlist.replace(f'{name}', f'texp{exp}s_{name}')
-                        grb = RTACtoolsAnalysis()
-                        grb.caldb = caldb
-                        grb.irf = irf
-                        grb.roi = cfg.get('roi')
-                        grb.e = erange
-                        if cfg.get('lightcurve'):
-                            grb.t = [t, t + exp]
-                        else: 
-                            grb.t = [cfg.get('delay'), cfg.get('delay')+t]
+                        trange = [tstart[k], tstop[k]]
                         if args.print.lower() == 'true':
-                            print(f"Selection t = {grb.t} s")
-                        texp = grb.t[1] - grb.t[0]
+                            print(f"Selection t = {trange} s")
+                        texp = trange[1] - trange[0]
                         if args.print.lower() == 'true':
                             print(f"Exposure = {texp} s")
-                        grb.input = phlist
-                        grb.output = selphlist
-                        if args.merge.lower() == 'true':
-                            grb.run_selection()
-                        else:
-                            prefix = join(grbpath, f'texp{exp}s_')
-                            grb.run_selection(prefix=prefix)
 
-                         # on/off ---!
-                        if '.fits' in selphlist:
-                            events_type = 'events_filename'
-                        else:
-                            events_type = 'events_list'
-                            filenames = ManageXml(selphlist)
-                            run_list = filenames.getRunList()
-                            filenames.closeXml()
-                            del filenames
-                            selphlist = Photometrics.load_data_from_fits_file(run_list[0])
-                            for file in run_list[1:]:
-                                selphlist = np.append(selphlist, Photometrics.load_data_from_fits_file(file))
-                        
                         # aperture photometry ---!
-                        phm = Photometrics({events_type: selphlist})
-                        pointing = tuple(pointing)
-                        opts = phm_options(erange=grb.e, texp=texp, time_int=grb.t, target=target, pointing=pointing, index=cfg.get('index'), save_off_reg=f"{expandvars(cfg.get('data'))}/rta_products/{runid}/texp{exp}s_{name}_off_regions.reg", irf_file=join(expandvars('$CTOOLS'), f"share/caldb/data/cta/{caldb}/bcf/{irf}/irf_file.fits"))
-                        off_regions = find_off_regions(phm, opts['background_method'], target, pointing, opts['region_radius'], verbose=opts['verbose'], save=opts['save_off_regions'])
-                        oncounts, offcounts, alpha, excess, sigma, err_note = counting(phm, target, opts['region_radius'], off_regions, e_min=opts['energy_min'], e_max=opts['energy_max'], t_min=opts['begin_time'], t_max=opts['end_time'], draconian=False)
+                        oncounts, offcounts = photometry['on'][k], photometry['off'][k]
+                        alpha, excess, sigma = photometry['alpha'], photometry['excess'][k], photometry['sigma'][k]
                         if args.print.lower() == 'true':
                             print(f'Photometry on={oncounts} off={offcounts} ex={excess} a={alpha}')
                             print('Li&Ma significance:', sigma)
 
                         # flux ---!
                         src = {'ra': target[0], 'dec': target[1], 'rad': opts['region_radius']}
+                        opts['begin_time'], opts['end_time'] = trange
                         conf = ObjectConfig(opts)
-                        start = time.time()
                         region_eff_resp = aeff_eval(conf, src, {'ra': pointing[0], 'dec': pointing[1]})
-                        print(time.time()-start)
                         livetime = opts['end_time'] - opts['begin_time']
                         flux = excess / region_eff_resp / livetime
                         k0, e0, flux_err, sqrt_ts = np.nan, np.nan, np.nan, np.nan
@@ -222,7 +220,7 @@ for runid in runids:
                         if args.print.lower() == 'true':
                             print(f'Flux={flux}')
 
-                        if sigma < 5 or grb.t[1] > (cfg.get('tobs')+cfg.get('delay')):
+                        if sigma < 5 or trange[1] > (cfg.get('tobs')+cfg.get('delay')):
                             break
 
                         elif sigma < 5 and cfg.get('lightcurve'):
@@ -234,7 +232,7 @@ for runid in runids:
                                 sys.exit(f"No significance detection with maximum exposure {texp} s.")
 
                         # save results ---!
-                        row = f"{runid} {count} {grb.t[0]} {grb.t[1]} {grb.t[1]-grb.t[-0]} {sqrt_ts} {flux} {flux_err} {ra} {dec} {k0} {gamma} {e0} {oncounts} {offcounts} {alpha} {excess} {sigma} {offset} {cfg.get('delay')} {cfg.get('scalefluxfactor')} {caldb} {irf} rtatool1d\n"
+                        row = f"{runid} {count} {trange[0]} {trange[1]} {trange[1]-trange[0]} {sqrt_ts} {flux} {flux_err} {ra} {dec} {k0} {gamma} {e0} {oncounts} {offcounts} {alpha} {excess} {sigma} {offset} {cfg.get('delay')} {cfg.get('scalefluxfactor')} {caldb} {irf} rtatool1d\n"
                         if args.print.lower() == 'true':
                             print(f"Results: {row}")
                         if not isfile(logname):
@@ -248,10 +246,10 @@ for runid in runids:
                             log.write(row)
                             log.close()
 
-                        del grb, phm
+                    del onoff
+                del phm
                 if args.remove.lower() == 'true':
                     # remove files ---!
-                    os.system(f"rm {datapath}/obs/{runid}/texp*{name}*")
                     os.system(f"rm {datapath}/rta_products/{runid}/*{name}*")
 print('...done.\n')
 
@@ -18,10 +18,10 @@ from rtasci.lib.RTAUtils import get_pointing, get_mergermap, phm_options
 from rtasci.lib.RTAUtilsGW import get_alert_pointing_gw
 from rtasci.cfg.Config import Config
 from rtasci.aph.utils import *
+from rtasci.aph.irf import get_irf
 from astropy.coordinates import SkyCoord
 from gammapy.analysis import Analysis, AnalysisConfig
 from gammapy.data import EventList, GTI, Observation, Observations
-from gammapy.irf import load_cta_irfs
 from gammapy.estimators import ExcessMapEstimator
 from gammapy.estimators.utils import find_peaks
 from rtasci.lib.RTAGammapyAnalysis import *
@@ -142,7 +142,7 @@ for runid in runids:
         # selection ---!
         for texp in times:
             # load irf
-            irf = load_cta_irfs(f"{expandvars('$CTOOLS')}/share/caldb/data/cta/{cfg.get('caldb')}/bcf/{cfg.get('irf')}/irf_file.fits")
+            irf = get_irf(f"{expandvars('$CTOOLS')}/share/caldb/data/cta/{cfg.get('caldb')}/bcf/{cfg.get('irf')}/irf_file.fits").gammapy()
             obs_id = count
             if args.print.lower() == 'true':
                 print(f"Exposure = {texp} s")
@@ -270,9 +270,7 @@ for runid in runids:
                     run_list = filenames.getRunList()
                     filenames.closeXml()
                     del filenames
-                    selphlist = Photometrics.load_data_from_fits_file(run_list[0])
-                    for file in run_list[1:]:
-                        selphlist = np.append(selphlist, Photometrics.load_data_from_fits_file(file))
+                    selphlist = Photometrics.load_data_from_fits_files(run_list)
                 # aperture photometry ---!
                 phm = Photometrics({events_type: selphlist})
                 opts = phm_options(cfg, texp=texp, start=grb.t[0], stop=grb.t[1], caldb=cfg.get('caldb'), irf=cfg.get('irf'), target=(ra_ctools, dec_ctools), pointing=pointing, runid=runid, prefix=f"texp{texp}s_{name}_")
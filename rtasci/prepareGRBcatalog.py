@@ -17,6 +17,7 @@ from rtasci.cfg.Config import Config
 
 parser = argparse.ArgumentParser(description='This script extracts spectra and lightcurves from the GRB templates, in order to prepare all required files for the simulation.')
 parser.add_argument('-f', '--cfgfile', type=str, required=True, help="Path to the yaml configuration file")
+parser.add_argument('-tol', '--coarsen-tolerance', type=float, default=None, help="Merge adjacent template time bins whose counts differ less than this relative tolerance")
 args = parser.parse_args()
 
 cfg = Config(args.cfgfile)
@@ -98,6 +99,10 @@ for runid in runids:
     # load template ---!
     if cfg.get('extract_data'):
         sim.extract_spectrum = True
+        sim.coarsen_tolerance = args.coarsen_tolerance
         print('Creating lightcurves and spectra')
     sim.loadTemplate(source_name=runid, return_bin=False, data_path=join(datapath, f'extracted_data/{runid}'), scalefluxfactor=cfg.get('scalefluxfactor'))
+    if sim.coarsening_report is not None:
+        report = sim.coarsening_report
+        print(f"Merged {report['bins']} time bins into {report['merged_bins']}, expected counts bias: {report['max_bin_bias']:.2%} per bin, {report['max_cumulative_bias']:.2%} cumulative")
 
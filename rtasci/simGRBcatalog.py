@@ -26,6 +26,8 @@ def main():
     parser.add_argument('-f', '--cfgfile', type=str, required=True, help="Path to the yaml configuration file")
     parser.add_argument('--merge', type=str2bool, default=True, help='Merge in single phlist (true) or use observation library (false)')
     parser.add_argument('--remove', type=str2bool, default=True, help='Keep only outputs')
+    parser.add_argument('--on-ram', type=str2bool, default=False, help='Keep the simulated bins in memory and write only the merged phlist')
+    parser.add_argument('--single-call', type=str2bool, default=False, help='Simulate all template bins with a single ctobssim call, in memory')
     parser.add_argument('--print', type=str2bool, default=False, help='Print out results')
     parser.add_argument('-mp', '--mp-enabled', type=str2bool, default=False, help='To parallelize trials loop')
     parser.add_argument('-mpt', '--mp-threads', type=int, default=4, help='The size of the threads pool') 
@@ -33,6 +35,8 @@ def main():
 
     if args.remove and not args.merge:
         raise ValueError('Keyword "remove" cannot be True if keyword "merge" is False.')
+    if (args.on_ram or args.single_call) and not args.merge:
+        raise ValueError('Keywords "on-ram" and "single-call" cannot be True if keyword "merge" is False.')
 
     cfg = Config(args.cfgfile)
     # GRB ---!
@@ -96,10 +100,10 @@ def main():
         # ---------------------------------------------------- loop trials ---!!!
         if args.mp_enabled:                
             with Pool(args.mp_threads) as p:
-                times = p.map(simulateTrial, [ (i, cfg, pointing, tmax, datapath, runid, tcsv, grbpath, bkg_model, args.print, args.merge, args.remove) for i in range(trials)])
+                times = p.map(simulateTrial, [ (i, cfg, pointing, tmax, datapath, runid, tcsv, grbpath, bkg_model, args.print, args.merge, args.remove, args.on_ram, args.single_call) for i in range(trials)])
         else:
             for i in range(trials):
-                times = simulateTrial((i, cfg, pointing, tmax, datapath, runid, tcsv, grbpath, bkg_model, args.print, args.merge, args.remove))
+                times = simulateTrial((i, cfg, pointing, tmax, datapath, runid, tcsv, grbpath, bkg_model, args.print, args.merge, args.remove, args.on_ram, args.single_call))
         # time ---!
         if args.print:
             if len(times) > 1:
@@ -123,12 +127,16 @@ def simulateTrial(trial_args):
     verbose=trial_args[9]
     merge=trial_args[10]
     remove=trial_args[11]
+    on_ram=trial_args[12]
+    single_call=trial_args[13]
 
     # initialise ---!
     count = cfg.get('start_count') + i + 1
     name = f'ebl{count:06d}'
+    # the single call simulation is merged from memory ---!
+    on_ram = on_ram or single_call
     # setup ---!
-    sim = RTACtoolsSimulation()
+    sim = RTACtoolsSimulation(on_ram=on_ram)
     if type(cfg.get('caldb')) == list:
         sim.caldb = cfg.get('caldb')[0]
     else:
@@ -154,29 +162,38 @@ def simulateTrial(trial_args):
 
     # -------------------------------------------------------- simulate ---!!!
     print(f'Simulate template seed={sim.seed}')
+    times, models, outputs = [], [], []
     for j in range(tbin_stop-tbin_start-1):
-        sim.t = [tgrid[j]+cfg.get('onset'), tgrid[j + 1]+cfg.get('onset')]
-        if verbose:
-            print(f'GTI (bin) = {sim.t} s')
-        sim.model = join(datapath, f'extracted_data/{runid}/{runid}_tbin{tbin_start+j:02d}.xml')
-        event = join(grbpath, f'{name}_tbin{tbin_start+j:02d}.fits')
-        event_bins.append(event)
-        sim.output = event
-        sim.run_simulation()
+        times.append([tgrid[j]+cfg.get('onset'), tgrid[j + 1]+cfg.get('onset')])
+        models.append(join(datapath, f'extracted_data/{runid}/{runid}_tbin{tbin_start+j:02d}.xml'))
+        outputs.append(join(grbpath, f'{name}_tbin{tbin_start+j:02d}.fits'))
     # -------------------------------------------- shift time --- !!!
     if cfg.get('onset') != 0:
         if cfg.get('delay') != 0:
             raise ValueError('Bad configuration. Either "onset" or "delay" must be equal to 0.')
         # ------------------------------------ add background --- !!!
         print('Simulate bkg to append before the burst')
-        bkg = os.path.join(grbpath, f'bkg{count:06d}.fits')
-        event_bins.insert(0, bkg)
-        sim.t = [0, cfg.get('onset')]
+        times.insert(0, [0, cfg.get('onset')])
+        models.insert(0, bkg_model)
+        outputs.insert(0, os.path.join(grbpath, f'bkg{count:06d}.fits'))
+    if single_call:
         if verbose:
-            print(f"GTI (bkg) = {sim.t} s")
-        sim.model = bkg_model
-        sim.output = bkg
-        sim.run_simulation()
+            print(f'GTI (all bins) = {[times[0][0], times[-1][1]]} s')
+        sim.output = str()
+        event_bins.append(sim.run_timevariable_simulation(models=models, times=times))
+    else:
+        for t, model, output in zip(times, models, outputs):
+            sim.t = t
+            if verbose:
+                print(f'GTI (bin) = {sim.t} s')
+            sim.model = model
+            if on_ram:
+                sim.output = str()
+                event_bins.append(sim.run_simulation())
+            else:
+                sim.output = output
+                event_bins.append(output)
+                sim.run_simulation()
 
     # ---------------------------------------- gather bins ---!!!
     if merge:
@@ -200,8 +217,7 @@ def simulateTrial(trial_args):
             os.remove(obslist)
         make_obslist(obslist=obslist, items=event_bins, names=name)
 
-    sim.input = phlist
-    sim.sortObsEvents()
+    # the merged phlist is already sorted and reindexed ---!
     del sim
 
     # selections ---!
@@ -224,12 +240,12 @@ def simulateTrial(trial_args):
             grb.run_selection(prefix=prefix) """
 
     # remove files ---!
-    if remove and merge:
-        # remove bins ---!
-        os.system('rm ' + join(grbpath, f'{name}*tbin*'))
-        if cfg.get('onset') != 0:
-            # remove bkg ---!
-            os.system('rm ' + join(grbpath, f'{name.replace("ebl", "bkg")}*'))
+    if remove and merge and not on_ram:
+        # remove bins and bkg with their logs ---!
+        for event in event_bins:
+            for f in (event, event.replace('.fits', '.log')):
+                if isfile(f):
+                    os.remove(f)
 
     # time ---!   
     elapsed_t = time()-start_t